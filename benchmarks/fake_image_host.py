@@ -0,0 +1,75 @@
+import json
+import asyncio
+from collections import Counter, deque
+from typing import Deque, Optional
+
+import httpx
+
+from utils.image_uploader import ImageUploader, SmmsBackend
+
+class FakeImageHost:
+    """SM.MS 上传接口的本地替身，通过 httpx.MockTransport 接入 ImageUploader
+
+    默认每次上传都成功；用 fail() 排队下一次请求的结果，用来检查重试、
+    退避和失败统计，不需要访问外网：
+
+        host = FakeImageHost()
+        host.fail("status", 503)
+        uploader = host.uploader()
+    """
+
+    URL = "https://images.test/api/v2/upload"
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = Counter()
+        self._failures: Deque[tuple] = deque()
+
+    def fail(self, kind: str, status: int = 500, times: int = 1):
+        """排队接下来 times 次请求的失败方式：status、invalid_json、rejected、connect"""
+        self._failures.extend([(kind, status)] * times)
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls["upload"] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self._failures:
+            kind, status = self._failures.popleft()
+            self.calls[kind] += 1
+            if kind == "connect":
+                raise httpx.ConnectError("connection refused", request=request)
+            if kind == "status":
+                return httpx.Response(status, text="error")
+            if kind == "invalid_json":
+                return httpx.Response(200, text="<html>bad gateway</html>")
+            if kind == "rejected":
+                return httpx.Response(200, json={"success": False, "message": "rejected"})
+        n = self.calls["upload"]
+        return httpx.Response(200, json={"success": True, "data": {"url": f"https://images.test/{n}.jpg"}})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    def uploader(self, max_concurrency: int = 4, retries: int = 2, backoff: float = 0.01,
+                 timeout: float = 5.0) -> ImageUploader:
+        return ImageUploader(
+            SmmsBackend(api_token="test", api_url=self.URL),
+            timeout=timeout, max_concurrency=max_concurrency, retries=retries,
+            backoff=backoff, transport=self.transport()
+        )
+
+async def _smoke(host: Optional[FakeImageHost] = None):
+    host = host or FakeImageHost()
+    uploader = host.uploader()
+    host.fail("status", 503)
+    host.fail("connect")
+    print("retried:", await uploader.upload_bytes(b"x", "a.jpg", "image/jpeg"))
+    host.fail("invalid_json")
+    print("invalid json:", await uploader.upload_bytes(b"x", "b.jpg", "image/jpeg"))
+    host.fail("rejected")
+    print("rejected:", await uploader.upload_bytes(b"x", "c.jpg", "image/jpeg"))
+    await uploader.aclose()
+    print(json.dumps(uploader.stats(), indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(_smoke())
@@ -0,0 +1,225 @@
+"""主要路由的性能测试
+
+在进程内运行 FastAPI 应用，数据库换成 benchmarks.fake_postgrest 中的本地 PostgREST 替身
+（可以注入固定延迟模拟网络往返），对每个路由测量 p50/p99 延迟和吞吐量，
+并统计每个请求到数据库的往返次数。往返次数超过 ROUND_TRIP_BUDGETS 时以状态码 1 退出，
+用来在上线前发现 N+1 查询。
+
+    python -m benchmarks.run --items 10000 --latency-ms 5 --requests 200 --concurrency 8
+"""
+import io
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_postgrest import FakePostgrest
+
+# 缓存全部失效时每个请求允许的数据库往返次数
+ROUND_TRIP_BUDGETS = {
+    "home": 2,       # 分类计数 + 一页商品
+    "item": 3,       # 商品 + 图片 + 第一页评论
+    "like": 1,       # toggle_like
+    "add_item": 2    # 插入商品 + 批量插入图片
+}
+
+class Scenario:
+    """一个被测路由：build(i) 返回第 i 个请求的 (方法, 路径, httpx 参数)"""
+
+    def __init__(self, name: str, build: Callable[[int], Tuple[str, str, dict]], admin: bool = False):
+        self.name = name
+        self.build = build
+        self.admin = admin
+        self.budget = ROUND_TRIP_BUDGETS[name]
+
+def make_image(seed: int) -> bytes:
+    """每次生成内容不同的 JPEG，避免上传按内容哈希去重后跳过图片处理"""
+    from PIL import Image
+    image = Image.new("RGB", (800, 600), ((seed * 37) % 256, (seed * 91) % 256, (seed * 13) % 256))
+    image.putpixel((0, 0), (seed % 256, (seed >> 8) % 256, (seed >> 16) % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def build_scenarios(items: int, seed: int) -> Dict[str, Scenario]:
+    rng = random.Random(seed)
+
+    def home(i):
+        # 交替访问全部商品和各个分类（测试数据有 8 个分类）
+        category = i % 9
+        return "GET", f"/?category_id={category}" if category else "/", {}
+
+    def item(i):
+        return "GET", f"/item/{rng.randint(1, items)}", {}
+
+    def like(i):
+        return "POST", f"/api/items/{rng.randint(1, items)}/likes", {}
+
+    def add_item(i):
+        return "POST", "/add_item", {
+            "data": {
+                "title": f"Benchmark ürünü {i}",
+                "description": "Performans testi için eklendi",
+                "price": "100",
+                "condition": "good",
+                "category_id": str(i % 8 + 1)
+            },
+            "files": [("images", (f"bench-{i}.jpg", make_image(i), "image/jpeg"))]
+        }
+
+    return {
+        "home": Scenario("home", home),
+        "item": Scenario("item", item),
+        "like": Scenario("like", like),
+        "add_item": Scenario("add_item", add_item, admin=True)
+    }
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def clear_caches():
+    from utils.cache import catalog_cache, page_cache
+    catalog_cache.clear()
+    page_cache.clear()
+
+async def send(client, scenario: Scenario, i: int):
+    method, url, kwargs = scenario.build(i)
+    response = await client.request(method, url, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.text[:200]}")
+    return response
+
+async def count_round_trips(client, fake: FakePostgrest, scenario: Scenario, samples: int) -> Tuple[int, dict]:
+    """缓存清空后逐个发送请求，返回单个请求的最大往返次数和对应的调用明细"""
+    worst, worst_calls = 0, {}
+    for i in range(samples):
+        clear_caches()
+        fake.reset_counts()
+        await send(client, scenario, i)
+        if fake.round_trips >= worst:
+            worst, worst_calls = fake.round_trips, dict(fake.calls)
+    return worst, worst_calls
+
+async def run_load(client, scenario: Scenario, requests: int, concurrency: int, cold: bool) -> dict:
+    """并发发送 requests 个请求，返回延迟分布和吞吐量"""
+    latencies: List[float] = []
+    errors: List[str] = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            if cold:
+                clear_caches()
+            start = time.perf_counter()
+            try:
+                await send(client, scenario, i)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50": percentile(latencies, 50) * 1000 if latencies else None,
+        "p99": percentile(latencies, 99) * 1000 if latencies else None,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--items", type=int, default=10000, help="测试数据中的商品数（例如 100 / 10000 / 100000）")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="每次数据库往返注入的延迟（毫秒）")
+    parser.add_argument("--requests", type=int, default=200, help="每个路由的请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数")
+    parser.add_argument("--cold", action="store_true", help="每个请求前清空缓存，测量未命中缓存时的延迟")
+    parser.add_argument("--routes", default=",".join(ROUND_TRIP_BUDGETS), help="要测试的路由，逗号分隔")
+    parser.add_argument("--samples", type=int, default=5, help="统计往返次数时每个路由发送的请求数")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+async def benchmark(args) -> int:
+    print(f"生成测试数据: {args.items} 个商品 ...", flush=True)
+    fake = FakePostgrest(latency=args.latency_ms / 1000)
+    fake.seed(args.items, seed=args.seed)
+
+    # 必须在导入应用之前设置：数据库地址、内存计数器、默认关闭的延迟写入
+    os.environ["SUPABASE_URL"] = fake.start()
+    os.environ["COUNTER_BACKEND"] = "memory"
+    os.environ.setdefault("WRITE_BEHIND", "0")
+    os.chdir(ROOT)
+
+    import httpx
+    from main import app
+    from utils import storage, image_processing
+
+    # 上传的图片写入临时目录，不污染 static/uploads
+    upload_dir = tempfile.mkdtemp(prefix="bench-uploads-")
+    storage.UPLOAD_DIR = upload_dir
+
+    # 不运行 lifespan：后台任务（热度刷新、计数写入）的查询不会混进路由的往返次数
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 50000))
+    anonymous = httpx.AsyncClient(transport=transport, base_url="http://bench")
+    admin = httpx.AsyncClient(transport=transport, base_url="http://bench")
+    failed = False
+    try:
+        response = await admin.post("/login", data={"username": "admin", "password": "admin123"})
+        if response.status_code != 303:
+            raise RuntimeError(f"管理员登录失败: {response.status_code}")
+
+        scenarios = build_scenarios(args.items, args.seed)
+        names = [name.strip() for name in args.routes.split(",") if name.strip()]
+        print(
+            f"延迟 {args.latency_ms}ms/往返, 每个路由 {args.requests} 个请求, 并发 {args.concurrency}"
+            f"{', 缓存未命中' if args.cold else ''}\n"
+        )
+        print(f"{'route':<10} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7} {'round trips':>12} {'budget':>7}")
+
+        for name in names:
+            scenario = scenarios[name]
+            client = admin if scenario.admin else anonymous
+            round_trips, calls = await count_round_trips(client, fake, scenario, args.samples)
+            clear_caches()
+            result = await run_load(client, scenario, args.requests, args.concurrency, args.cold)
+
+            over_budget = round_trips > scenario.budget
+            failed |= over_budget or bool(result["errors"])
+            p50 = f"{result['p50']:.2f}" if result["p50"] is not None else "-"
+            p99 = f"{result['p99']:.2f}" if result["p99"] is not None else "-"
+            print(
+                f"{name:<10} {p50:>9} {p99:>9} {result['throughput']:>9.1f} {len(result['errors']):>7} "
+                f"{round_trips:>12} {scenario.budget:>7}{'  OVER BUDGET' if over_budget else ''}"
+            )
+            if over_budget:
+                for call, count in sorted(calls.items()):
+                    print(f"{'':<12}{count} x {call}")
+            for error in result["errors"][:3]:
+                print(f"{'':<12}{error}")
+    finally:
+        await anonymous.aclose()
+        await admin.aclose()
+        image_processing.shutdown()
+        fake.stop()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    return 1 if failed else 0
+
+def main(argv=None):
+    sys.exit(asyncio.run(benchmark(parse_args(argv))))
+
+if __name__ == "__main__":
+    main()
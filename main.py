@@ -1,13 +1,40 @@
 import os
-from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from routes import items, auth, api, admin
 from utils.template_filters import format_datetime
+from utils.write_behind import write_behind
+from utils import image_processing
+from utils.image_uploader import image_uploader
+from utils.static_assets import static_assets, AssetStaticFiles
+from utils.middleware import CompressionMiddleware
+from utils.visit_tracker import visit_tracker
+from utils.counters import counters
+from utils.popularity import popularity
+from database import get_db
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动点赞/评论的延迟写入任务，关闭时写入剩余数据
+    if write_behind.enabled:
+        write_behind.start(await get_db())
+    # 访问计数批量写入共享存储；在线人数等统计按固定间隔合并广播
+    await counters.start()
+    visit_tracker.start()
+    # 商品浏览量批量写入 item_stats，并定期重算热度排行
+    popularity.start(await get_db())
+    yield
+    await visit_tracker.stop()
+    await counters.stop()
+    await popularity.stop()
+    await write_behind.stop()
+    image_processing.shutdown()
+    await image_uploader.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置中间件
 app.add_middleware(
@@ -24,15 +51,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 挂载静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# HTML/JSON 响应的 ETag、304 和 gzip/brotli 压缩
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+)
+
+# 挂载静态文件（CSS/JS/图片使用带哈希的文件名并长期缓存）
+static_assets.build()
+app.mount("/static", AssetStaticFiles(directory="static", assets=static_assets), name="static")
 
 # 配置模板
 templates = Jinja2Templates(directory="templates")
 templates.env.filters["format_datetime"] = format_datetime
+templates.env.globals["static_url"] = static_assets.url
 
 # 注册路由
 app.include_router(items.router)
 app.include_router(auth.router)
 app.include_router(api.router)
 app.include_router(admin.router)
+
+# 实时访问统计
+@app.websocket("/ws/stats")
+async def stats_websocket(websocket: WebSocket):
+    connection_id = await visit_tracker.connect(websocket)
+    try:
+        # 客户端不发送数据，这里只用来感知断开
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await visit_tracker.disconnect(connection_id)
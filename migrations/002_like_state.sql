@@ -0,0 +1,12 @@
+-- 单次查询返回商品的点赞数以及指定 IP 是否已点赞
+create or replace function get_like_state(p_item_id bigint, p_ip_address text)
+returns table (likes_count int, user_liked boolean)
+language sql stable
+as $$
+    select count(*)::int,
+           coalesce(bool_or(ip_address = p_ip_address), false)
+    from likes
+    where item_id = p_item_id;
+$$;
+
+create index if not exists likes_item_id_ip_address_idx on likes (item_id, ip_address);
@@ -0,0 +1,7 @@
+-- 首页按 (is_sold, id desc) 做 keyset 分页，is_sold 不能为 NULL
+update items set is_sold = false where is_sold is null;
+alter table items alter column is_sold set default false;
+alter table items alter column is_sold set not null;
+
+create index if not exists items_is_sold_id_idx on items (is_sold, id desc);
+create index if not exists items_category_is_sold_id_idx on items (category_id, is_sold, id desc);
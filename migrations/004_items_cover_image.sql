@@ -0,0 +1,12 @@
+-- 首页列表只需要每个商品的一张封面图，冗余存储在 items 上
+alter table items add column if not exists cover_image_url text;
+
+update items i
+set cover_image_url = (
+    select image_url from item_images
+    where item_id = i.id
+    order by id
+    limit 1
+);
+
+create index if not exists item_images_item_id_idx on item_images (item_id, id);
@@ -0,0 +1,40 @@
+-- 点赞数冗余存储在 items.likes_count 上，由触发器维护，读取为 O(1)
+alter table items add column if not exists likes_count int not null default 0;
+
+update items i
+set likes_count = (select count(*) from likes where item_id = i.id);
+
+create or replace function likes_count_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        update items set likes_count = likes_count + 1 where id = new.item_id;
+        return new;
+    elsif tg_op = 'DELETE' then
+        update items set likes_count = greatest(likes_count - 1, 0) where id = old.item_id;
+        return old;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists likes_count_trigger on likes;
+create trigger likes_count_trigger
+after insert or delete on likes
+for each row execute function likes_count_trigger();
+
+-- get_like_state 改为读取冗余计数，只检查当前 IP 的一行
+create or replace function get_like_state(p_item_id bigint, p_ip_address text)
+returns table (likes_count int, user_liked boolean)
+language sql stable
+as $$
+    select i.likes_count,
+           exists (
+               select 1 from likes l
+               where l.item_id = p_item_id and l.ip_address = p_ip_address
+           )
+    from items i
+    where i.id = p_item_id;
+$$;
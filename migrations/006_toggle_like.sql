@@ -0,0 +1,33 @@
+-- 每个 IP 对每个商品只能点赞一次；先清理历史上的重复点赞
+delete from likes l
+using likes d
+where l.item_id = d.item_id
+  and l.ip_address = d.ip_address
+  and l.id > d.id;
+
+update items i
+set likes_count = (select count(*) from likes where item_id = i.id);
+
+drop index if exists likes_item_id_ip_address_idx;
+create unique index if not exists likes_item_id_ip_address_key on likes (item_id, ip_address);
+
+-- 原子地切换点赞状态，一次往返返回新的点赞状态和点赞数
+create or replace function toggle_like(p_item_id bigint, p_ip_address text)
+returns table (liked boolean, likes_count int)
+language plpgsql
+as $$
+begin
+    delete from likes where item_id = p_item_id and ip_address = p_ip_address;
+    if found then
+        liked := false;
+    else
+        insert into likes (item_id, ip_address, created_at)
+        values (p_item_id, p_ip_address, now())
+        on conflict (item_id, ip_address) do nothing;
+        liked := true;
+    end if;
+
+    select i.likes_count into likes_count from items i where i.id = p_item_id;
+    return next;
+end;
+$$;
@@ -0,0 +1,3 @@
+-- 上传时生成的缩略图和卡片尺寸 WebP 变体；image_url 保存大图变体
+alter table item_images add column if not exists thumb_url text;
+alter table item_images add column if not exists card_url text;
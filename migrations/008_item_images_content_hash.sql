@@ -0,0 +1,4 @@
+-- 上传文件按内容 SHA-256 命名，相同内容只存一份；删除时按 content_hash 统计引用
+alter table item_images add column if not exists content_hash text;
+
+create index if not exists item_images_content_hash_idx on item_images (content_hash);
@@ -0,0 +1,37 @@
+-- 商品浏览统计：views 是累计浏览量，score 是按半衰期指数衰减的热度（截至 score_updated_at）
+create table if not exists item_stats (
+    item_id bigint primary key references items (id) on delete cascade,
+    views bigint not null default 0,
+    score double precision not null default 0,
+    score_updated_at timestamptz not null default now()
+);
+
+-- 批量写入浏览量：p_views 为 [{"item_id": 1, "views": 3}, ...]
+-- 旧热度先衰减到当前时间再加上新增浏览量；已删除的商品被忽略
+create or replace function record_item_views(p_views jsonb, p_half_life_seconds double precision)
+returns void
+language sql
+as $$
+    insert into item_stats as s (item_id, views, score, score_updated_at)
+    select i.id, v.views, v.views, now()
+    from jsonb_to_recordset(p_views) as v (item_id bigint, views bigint)
+    join items i on i.id = v.item_id
+    on conflict (item_id) do update set
+        views = s.views + excluded.views,
+        score = s.score * power(0.5, extract(epoch from now() - s.score_updated_at) / p_half_life_seconds)
+                + excluded.score,
+        score_updated_at = now();
+$$;
+
+-- 按衰减到当前时间的热度排序，返回前 p_limit 个商品
+create or replace function get_popular_items(p_half_life_seconds double precision, p_limit int)
+returns table (item_id bigint, score double precision)
+language sql
+stable
+as $$
+    select s.item_id,
+           s.score * power(0.5, extract(epoch from now() - s.score_updated_at) / p_half_life_seconds) as score
+    from item_stats s
+    order by 2 desc
+    limit p_limit;
+$$;
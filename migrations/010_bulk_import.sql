@@ -0,0 +1,12 @@
+-- 批量导入：source_key 标识商品在导入文件中的来源，重复导入时按它更新而不是新增
+alter table items add column if not exists source_key text;
+create unique index if not exists items_source_key_key on items (source_key);
+
+-- 同一个商品不重复引用同一张图片，重复导入时图片记录可以直接 upsert
+delete from item_images a
+using item_images b
+where a.item_id = b.item_id
+  and a.image_url = b.image_url
+  and a.id > b.id;
+
+create unique index if not exists item_images_item_id_image_url_key on item_images (item_id, image_url);
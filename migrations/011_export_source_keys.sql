@@ -0,0 +1,29 @@
+-- 导出的快照可以恢复到同一个数据库：现有商品和评论也有 source_key，恢复时按它更新而不是新增
+update items set source_key = 'item:' || id where source_key is null;
+
+alter table comments add column if not exists source_key text;
+update comments set source_key = 'comment:' || id where source_key is null;
+create unique index if not exists comments_source_key_key on comments (source_key);
+
+-- 新插入的记录没有 source_key 时按 id 生成（BEFORE 触发器执行时 id 默认值已经生成）
+create or replace function set_default_source_key()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.source_key is null then
+        new.source_key := tg_argv[0] || new.id;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists items_default_source_key on items;
+create trigger items_default_source_key
+before insert on items
+for each row execute function set_default_source_key('item:');
+
+drop trigger if exists comments_default_source_key on comments;
+create trigger comments_default_source_key
+before insert on comments
+for each row execute function set_default_source_key('comment:');
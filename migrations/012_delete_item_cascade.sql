@@ -0,0 +1,74 @@
+-- 在一个事务里删除商品及其图片、评论和点赞
+-- 返回一行 (deleted: 是否删除了商品, files: 不再被任何记录引用的图片)，文件由应用在后台删除
+create or replace function delete_item_cascade(p_item_id bigint)
+returns table (deleted boolean, files jsonb)
+language plpgsql
+as $$
+declare
+    v_files jsonb;
+begin
+    with removed as (
+        delete from item_images
+        where item_id = p_item_id
+        returning image_url, thumb_url, card_url, content_hash
+    ), orphaned as (
+        -- 同一条语句中仍能看到被删除的行，所以排除本商品的图片
+        select distinct r.image_url, r.thumb_url, r.card_url, r.content_hash
+        from removed r
+        where r.content_hash is null
+           or not exists (
+               select 1 from item_images o
+               where o.content_hash = r.content_hash and o.item_id <> p_item_id
+           )
+    )
+    select coalesce(jsonb_agg(to_jsonb(orphaned)), '[]'::jsonb) into v_files from orphaned;
+
+    delete from comments where item_id = p_item_id;
+    delete from likes where item_id = p_item_id;
+    delete from items where id = p_item_id;
+
+    deleted := found;
+    files := v_files;
+    return next;
+end;
+$$;
+
+-- 删除商品的部分图片并重新计算封面
+-- 返回一行 (cover_image_url: 新封面, files: 不再被任何记录引用的图片)
+create or replace function delete_item_images(p_item_id bigint, p_image_ids bigint[])
+returns table (cover_image_url text, files jsonb)
+language plpgsql
+as $$
+declare
+    v_files jsonb;
+    v_cover text;
+begin
+    with removed as (
+        delete from item_images
+        where item_id = p_item_id and id = any(p_image_ids)
+        returning image_url, thumb_url, card_url, content_hash
+    ), orphaned as (
+        select distinct r.image_url, r.thumb_url, r.card_url, r.content_hash
+        from removed r
+        where r.content_hash is null
+           or not exists (
+               select 1 from item_images o
+               where o.content_hash = r.content_hash
+                 and not (o.item_id = p_item_id and o.id = any(p_image_ids))
+           )
+    )
+    select coalesce(jsonb_agg(to_jsonb(orphaned)), '[]'::jsonb) into v_files from orphaned;
+
+    select coalesce(i.card_url, i.image_url) into v_cover
+    from item_images i
+    where i.item_id = p_item_id
+    order by i.id
+    limit 1;
+
+    update items set cover_image_url = v_cover where id = p_item_id;
+
+    cover_image_url := v_cover;
+    files := v_files;
+    return next;
+end;
+$$;
@@ -0,0 +1,2 @@
+-- 商品页评论按 (created_at, id) 倒序做 keyset 分页
+create index if not exists comments_item_id_created_at_id_idx on comments (item_id, created_at desc, id desc);
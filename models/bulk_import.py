@@ -0,0 +1,46 @@
+import re
+from pydantic import BaseModel, field_validator
+from typing import Optional, List, Union
+from datetime import datetime
+
+class ItemImport(BaseModel):
+    """批量导入的一条商品记录，分类按名称引用，source_key 用于重复导入时更新而不是新增"""
+    source_key: str
+    title: str
+    description: str = ""
+    price: float
+    new_price: Optional[float] = None
+    condition: str = "good"
+    category: str
+    is_sold: bool = False
+    # 图片 URL、导入包内的相对路径，或导出文件中的 item_images 记录
+    images: List[Union[str, dict]] = []
+
+    @field_validator("price", "new_price", mode="before")
+    @classmethod
+    def parse_price(cls, value):
+        """接受 "1.250,50 TL"、"1250.5" 这样的价格字符串"""
+        if not isinstance(value, str):
+            return value
+        value = re.sub(r"[^0-9.,]", "", value)
+        if not value:
+            return None
+        if "," in value:
+            value = value.replace(".", "").replace(",", ".")
+        return value
+
+    @field_validator("is_sold", mode="before")
+    @classmethod
+    def parse_is_sold(cls, value):
+        if isinstance(value, str) and not value.strip():
+            return False
+        return value
+
+class CommentImport(BaseModel):
+    """快照中的一条评论，通过 item_source_key 关联到商品"""
+    source_key: str
+    item_source_key: str
+    commenter_name: str = "Anonim"
+    username: Optional[str] = None
+    content: str
+    created_at: Optional[datetime] = None
@@ -1,15 +1,37 @@
-from fastapi import APIRouter, Request, Depends, Form, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+from fastapi import APIRouter, Request, Depends, Form, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import List
 from datetime import datetime
-import uuid
-import os
 from database import get_db
-from supabase import Client
+from supabase import AsyncClient
+from utils.catalog import get_categories_with_counts, delete_item_cascade, delete_item_images
+from utils.cache import invalidate_item, invalidate_categories
+from utils.storage import CHUNK_SIZE, save_uploads, remove_unreferenced_files
+from utils.search import search_index
+from utils.static_assets import static_assets
+from utils.bulk_importer import BulkImporter, DirectorySource, FileSource, ImportSource, open_source
+from utils.exporter import FORMATS, export_catalog, list_snapshots, snapshot_path
+
+# 「Markdown'dan İçe Aktar」按钮导入的服务器目录
+IMPORT_PRODUCTS_DIR = os.getenv("IMPORT_PRODUCTS_DIR", "products")
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
+
+async def insert_item_images(db: AsyncClient, item_id: int, images: List[dict]):
+    """一次批量插入商品的所有图片记录，同一商品重复的图片忽略"""
+    if images:
+        await db.table("item_images").upsert([
+            {"item_id": item_id, **image}
+            for image in images
+        ], on_conflict="item_id,image_url", ignore_duplicates=True).execute()
 
 def check_admin(request: Request):
     """检查用户是否是管理员"""
@@ -19,11 +41,11 @@ def check_admin(request: Request):
     return user
 
 @router.get("/admin", response_class=HTMLResponse)
-async def admin_page(request: Request, db: Client = Depends(get_db)):
+async def admin_page(request: Request, db: AsyncClient = Depends(get_db)):
     user = check_admin(request)
     
-    categories = db.table("categories").select("*").execute()
-    items = db.table("items").select("*, categories(name)").execute()
+    categories = await db.table("categories").select("*").execute()
+    items = await db.table("items").select("*, categories(name)").execute()
     
     return templates.TemplateResponse(
         "admin.html",
@@ -31,6 +53,7 @@ async def admin_page(request: Request, db: Client = Depends(get_db)):
             "request": request,
             "categories": categories.data,
             "items": items.data,
+            "snapshots": list_snapshots(),
             "user": user
         }
     )
@@ -43,60 +66,50 @@ async def create_item(
     price: float = Form(...),
     category_id: int = Form(...),
     images: List[UploadFile] = File(...),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     user = check_admin(request)
     
-    # 创建商品
+    # 保存图片
+    saved_images = await save_uploads(images)
+    
+    # 创建商品，第一张图片作为封面
     item_data = {
         "title": title,
         "description": description,
         "price": price,
         "category_id": category_id,
+        "cover_image_url": saved_images[0]["card_url"] if saved_images else None,
         "created_at": datetime.utcnow().isoformat()
     }
     
-    result = db.table("items").insert(item_data).execute()
+    result = await db.table("items").insert(item_data).execute()
     item_id = result.data[0]["id"]
+    search_index.upsert(result.data[0])
     
-    # 处理图片
-    for image in images:
-        if image.filename:
-            # 生成唯一文件名
-            ext = os.path.splitext(image.filename)[1]
-            filename = f"{uuid.uuid4()}{ext}"
-            
-            # 保存图片
-            with open(f"static/uploads/{filename}", "wb") as buffer:
-                content = await image.read()
-                buffer.write(content)
-            
-            # 保存图片信息到数据库
-            image_data = {
-                "item_id": item_id,
-                "image_url": f"/static/uploads/{filename}"
-            }
-            db.table("item_images").insert(image_data).execute()
+    # 保存图片信息到数据库
+    await insert_item_images(db, item_id, saved_images)
     
+    invalidate_item(item_id)
     return RedirectResponse(url="/admin", status_code=303)
 
 @router.get("/edit_item/{item_id}", response_class=HTMLResponse)
-async def edit_item_page(request: Request, item_id: int, db: Client = Depends(get_db)):
+async def edit_item_page(request: Request, item_id: int, db: AsyncClient = Depends(get_db)):
     # 检查用户是否是管理员
     user = request.session.get("user")
     if not user or not user.get("is_admin"):
         return RedirectResponse(url="/login")
     
     # 获取商品信息
-    item = db.table("items").select("*").eq("id", item_id).execute()
+    item = await db.table("items").select("*").eq("id", item_id).execute()
     if not item.data:
         raise HTTPException(status_code=404, detail="Item not found")
     
     # 获取商品图片
-    images = db.table("item_images").select("*").eq("item_id", item_id).execute()
+    images = await db.table("item_images").select("*").eq("item_id", item_id).execute()
     
     # 获取所有分类
-    categories = db.table("categories").select("*").execute()
+    categories = await db.table("categories").select("*").execute()
     
     return templates.TemplateResponse(
         "edit_item.html",
@@ -113,6 +126,7 @@ async def edit_item_page(request: Request, item_id: int, db: Client = Depends(ge
 async def edit_item(
     request: Request,
     item_id: int,
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(...),
     price: float = Form(...),
@@ -121,7 +135,7 @@ async def edit_item(
     category_id: int = Form(...),
     deleted_images: str = Form(""),
     images: list[UploadFile] = File(None),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     # 检查用户是否是管理员
     user = request.session.get("user")
@@ -143,56 +157,48 @@ async def edit_item(
         else:
             item_data["new_price"] = None  # 如果没有新价格，设置为 NULL
         
-        db.table("items").update(item_data).eq("id", item_id).execute()
+        result = await db.table("items").update(item_data).eq("id", item_id).execute()
+        if not result.data:
+            return JSONResponse(status_code=404, content={"message": "Item not found"})
+        search_index.upsert(result.data[0])
+        cover = result.data[0].get("cover_image_url")
         
-        # 处理删除的图片
-        if deleted_images:
-            deleted_ids = [int(id) for id in deleted_images.split(",") if id]
-            for image_id in deleted_ids:
-                # 获取图片信息
-                image = db.table("item_images").select("image_url").eq("id", image_id).execute()
-                if image.data:
-                    # 删除文件
-                    file_path = os.path.join(os.path.dirname(__file__), "..", image.data[0]["image_url"].lstrip("/"))
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    
-                    # 从数据库中删除
-                    db.table("item_images").delete().eq("id", image_id).execute()
+        # 删除选中的图片（数据库端一次完成并重新计算封面）
+        deleted_ids = [int(id) for id in deleted_images.split(",") if id]
+        files = []
+        if deleted_ids:
+            cover, files = await delete_item_images(db, item_id, deleted_ids)
         
         # 处理新上传的图片
-        if images:
-            for image in images:
-                if image.filename:
-                    # 生成唯一文件名
-                    file_extension = os.path.splitext(image.filename)[1]
-                    unique_filename = f"{uuid.uuid4()}{file_extension}"
-                    file_path = os.path.join("static/uploads", unique_filename)
-                    
-                    # 保存文件
-                    with open(file_path, "wb") as buffer:
-                        content = await image.read()
-                        buffer.write(content)
-                    
-                    # 保存到数据库
-                    db.table("item_images").insert({
-                        "item_id": item_id,
-                        "image_url": f"/static/uploads/{unique_filename}"
-                    }).execute()
+        saved_images = await save_uploads(images)
+        await insert_item_images(db, item_id, saved_images)
         
+        # 不再被引用的文件在响应后删除；重新上传的同一张图片复用了这些文件，不能删除
+        reused = {image["content_hash"] for image in saved_images}
+        files = [file for file in files if file.get("content_hash") not in reused]
+        if files:
+            background_tasks.add_task(remove_unreferenced_files, db, files)
+        
+        # 原来没有图片时，第一张新图片作为封面
+        if saved_images and not cover:
+            cover = saved_images[0]["card_url"]
+            await db.table("items").update({"cover_image_url": cover}).eq("id", item_id).execute()
+        search_index.update({"id": item_id, "cover_image_url": cover})
+        
+        invalidate_item(item_id)
         return JSONResponse(content={"success": True})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": str(e)})
 
 @router.get("/add_item", response_class=HTMLResponse)
-async def add_item_page(request: Request, db: Client = Depends(get_db)):
+async def add_item_page(request: Request, db: AsyncClient = Depends(get_db)):
     # 检查用户是否是管理员
     user = request.session.get("user")
     if not user or not user.get("is_admin"):
         return RedirectResponse(url="/login")
     
     # 获取所有分类
-    categories = db.table("categories").select("*").execute()
+    categories = await db.table("categories").select("*").execute()
     
     # 创建空的商品数据
     item = {
@@ -225,7 +231,7 @@ async def add_item(
     condition: str = Form(...),
     category_id: int = Form(...),
     images: list[UploadFile] = File(None),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     # 检查用户是否是管理员
     user = request.session.get("user")
@@ -233,47 +239,36 @@ async def add_item(
         return JSONResponse(status_code=403, content={"message": "Unauthorized"})
     
     try:
-        # 创建新商品
+        # 处理上传的图片
+        saved_images = await save_uploads(images)
+        
+        # 创建新商品，第一张图片作为封面
         item_data = {
             "title": title,
             "description": description,
             "price": price,
             "category_id": category_id,
             "condition": condition,
-            "is_sold": False
+            "is_sold": False,
+            "cover_image_url": saved_images[0]["card_url"] if saved_images else None
         }
         
         if new_price is not None and new_price != "":
             item_data["new_price"] = float(new_price)
             
         # 插入商品
-        result = db.table("items").insert(item_data).execute()
+        result = await db.table("items").insert(item_data).execute()
         
         if not result.data:
             raise Exception("Failed to create item")
             
         item_id = result.data[0]["id"]
+        search_index.upsert(result.data[0])
         
-        # 处理上传的图片
-        if images:
-            for image in images:
-                if image.filename:
-                    # 生成唯一文件名
-                    file_extension = os.path.splitext(image.filename)[1]
-                    unique_filename = f"{uuid.uuid4()}{file_extension}"
-                    file_path = os.path.join("static/uploads", unique_filename)
-                    
-                    # 保存文件
-                    with open(file_path, "wb") as buffer:
-                        content = await image.read()
-                        buffer.write(content)
-                    
-                    # 保存到数据库
-                    db.table("item_images").insert({
-                        "item_id": item_id,
-                        "image_url": f"/static/uploads/{unique_filename}"
-                    }).execute()
+        # 保存到数据库
+        await insert_item_images(db, item_id, saved_images)
         
+        invalidate_item(item_id)
         return JSONResponse(content={"success": True, "item_id": item_id})
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": str(e)})
@@ -282,7 +277,8 @@ async def add_item(
 async def delete_item(
     request: Request,
     item_id: int,
-    db: Client = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncClient = Depends(get_db)
 ):
     # 检查用户是否是管理员
     user = request.session.get("user")
@@ -290,33 +286,19 @@ async def delete_item(
         return JSONResponse(status_code=403, content={"message": "Unauthorized"})
     
     try:
-        # 获取商品的所有图片
-        images = db.table("item_images").select("*").eq("item_id", item_id).execute()
-        
-        # 删除图片文件
-        for image in images.data:
-            file_path = os.path.join(os.path.dirname(__file__), "..", image["image_url"].lstrip("/"))
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
-        # 删除数据库中的图片记录
-        db.table("item_images").delete().eq("item_id", item_id).execute()
-        
-        # 删除商品的评论
-        db.table("comments").delete().eq("item_id", item_id).execute()
+        # 图片、评论、点赞和商品在一个数据库事务中删除
+        files = await delete_item_cascade(db, item_id)
+        invalidate_item(item_id)
+        search_index.remove(item_id)
         
-        # 删除商品的点赞
-        db.table("likes").delete().eq("item_id", item_id).execute()
-        
-        # 删除商品
-        result = db.table("items").delete().eq("id", item_id).execute()
-        
-        if not result.data:
+        if files is None:
             return JSONResponse(
                 status_code=404,
                 content={"message": "Item not found"}
             )
         
+        # 不再被引用的图片文件在响应发送后批量删除
+        background_tasks.add_task(remove_unreferenced_files, db, files)
         return JSONResponse(content={"success": True})
     except Exception as e:
         return JSONResponse(
@@ -327,7 +309,7 @@ async def delete_item(
 @router.get("/categories")
 async def categories_page(
     request: Request,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """分类管理页面"""
     # 检查用户是否是管理员
@@ -335,19 +317,14 @@ async def categories_page(
     if not user or not user.get("is_admin"):
         return RedirectResponse(url="/login")
     
-    # 获取所有分类
-    categories = db.table("categories").select("*").execute()
-    
-    # 获取每个分类的商品数量
-    for category in categories.data:
-        items_count = db.table("items").select("id", count="exact").eq("category_id", category["id"]).execute()
-        category["items_count"] = items_count.count
+    # 获取所有分类及每个分类的商品数量
+    categories = await get_categories_with_counts(db)
     
     return templates.TemplateResponse(
         "categories.html",
         {
             "request": request,
-            "categories": categories.data,
+            "categories": categories,
             "user": user
         }
     )
@@ -357,7 +334,7 @@ async def create_category(
     request: Request,
     name: str = Form(...),
     description: str = Form(None),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """创建新分类"""
     # 检查用户是否是管理员
@@ -372,13 +349,15 @@ async def create_category(
         
         print("Inserting category with data:", data)
         # 使用 upsert 操作，让数据库自动处理 ID
-        result = db.table("categories").upsert(data).execute()
+        result = await db.table("categories").upsert(data).execute()
         print("Insert result:", result.data)
         
         # 检查是否成功插入
         if not result.data:
             raise Exception("Failed to insert category")
-            
+        
+        invalidate_categories()
+        
         return RedirectResponse(url="/categories", status_code=303)
     except Exception as e:
         print("Error creating category:", str(e))
@@ -390,7 +369,7 @@ async def create_category(
                     "request": request,
                     "error": "Bu kategori adı zaten kullanılıyor.",
                     "user": user,
-                    "categories": db.table("categories").select("*").execute().data
+                    "categories": (await db.table("categories").select("*").execute()).data
                 }
             )
         return templates.TemplateResponse(
@@ -399,7 +378,7 @@ async def create_category(
                 "request": request,
                 "error": str(e),
                 "user": user,
-                "categories": db.table("categories").select("*").execute().data
+                "categories": (await db.table("categories").select("*").execute()).data
             }
         )
 
@@ -407,7 +386,7 @@ async def create_category(
 async def edit_category_page(
     request: Request,
     category_id: int,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """编辑分类页面"""
     # 检查用户是否是管理员
@@ -416,23 +395,18 @@ async def edit_category_page(
         return RedirectResponse(url="/login")
     
     # 获取分类信息
-    category = db.table("categories").select("*").eq("id", category_id).execute()
+    category = await db.table("categories").select("*").eq("id", category_id).execute()
     if not category.data:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    # 获取所有分类
-    categories = db.table("categories").select("*").execute()
-    
-    # 获取每个分类的商品数量
-    for cat in categories.data:
-        items_count = db.table("items").select("id", count="exact").eq("category_id", cat["id"]).execute()
-        cat["items_count"] = items_count.count
+    # 获取所有分类及每个分类的商品数量
+    categories = await get_categories_with_counts(db)
     
     return templates.TemplateResponse(
         "categories.html",
         {
             "request": request,
-            "categories": categories.data,
+            "categories": categories,
             "edit_category": category.data[0],
             "user": user
         }
@@ -444,7 +418,7 @@ async def update_category(
     category_id: int,
     name: str = Form(...),
     description: str = Form(None),
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """更新分类"""
     # 检查用户是否是管理员
@@ -457,7 +431,8 @@ async def update_category(
         if description:
             data["description"] = description
         
-        db.table("categories").update(data).eq("id", category_id).execute()
+        await db.table("categories").update(data).eq("id", category_id).execute()
+        invalidate_categories()
         return RedirectResponse(url="/categories", status_code=303)
     except Exception as e:
         return templates.TemplateResponse(
@@ -473,7 +448,7 @@ async def update_category(
 async def delete_category(
     request: Request,
     category_id: int,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     """删除分类"""
     # 检查用户是否是管理员
@@ -483,7 +458,7 @@ async def delete_category(
     
     try:
         # 检查是否有商品使用此分类
-        items = db.table("items").select("id").eq("category_id", category_id).execute()
+        items = await db.table("items").select("id").eq("category_id", category_id).execute()
         if items.data:
             return JSONResponse(
                 status_code=400,
@@ -491,10 +466,109 @@ async def delete_category(
             )
         
         # 删除分类
-        db.table("categories").delete().eq("id", category_id).execute()
+        await db.table("categories").delete().eq("id", category_id).execute()
+        invalidate_categories()
         return JSONResponse(content={"success": True})
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"message": str(e)}
         )
+
+async def stream_import(importer: BulkImporter, source: ImportSource, skip: int = 0, fileobj=None):
+    """把导入进度逐行输出为 NDJSON，结束后关闭数据源和临时文件"""
+    try:
+        async for progress in importer.run(source, skip):
+            yield json.dumps(progress, ensure_ascii=False) + "\n"
+    except Exception as e:
+        yield json.dumps(importer.progress(done=True, error=str(e)), ensure_ascii=False) + "\n"
+    finally:
+        source.close()
+        if fileobj is not None:
+            fileobj.close()
+
+@router.post("/import-products")
+async def import_products(request: Request, skip: int = 0, db: AsyncClient = Depends(get_db)):
+    """从服务器上的 Markdown 目录批量导入商品"""
+    user = request.session.get("user")
+    if not user or not user.get("is_admin"):
+        return JSONResponse(status_code=403, content={"message": "Unauthorized"})
+    
+    if not os.path.isdir(IMPORT_PRODUCTS_DIR):
+        return JSONResponse(status_code=404, content={"message": f"Directory not found: {IMPORT_PRODUCTS_DIR}"})
+    
+    return StreamingResponse(
+        stream_import(BulkImporter(db), DirectorySource(IMPORT_PRODUCTS_DIR), skip),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/import-database")
+async def import_database(
+    request: Request,
+    file: UploadFile = File(...),
+    skip: int = Form(0),
+    db: AsyncClient = Depends(get_db)
+):
+    """从上传的压缩包或 CSV / NDJSON / JSON 文件批量导入商品"""
+    user = request.session.get("user")
+    if not user or not user.get("is_admin"):
+        return JSONResponse(status_code=403, content={"message": "Unauthorized"})
+    
+    # 上传文件在请求结束时会被关闭，先复制到导入过程自己的临时文件（在线程中复制，不阻塞事件循环）
+    fileobj = tempfile.TemporaryFile()
+    await file.seek(0)
+    await asyncio.to_thread(shutil.copyfileobj, file.file, fileobj, CHUNK_SIZE)
+    fileobj.seek(0)
+    
+    try:
+        source = open_source(fileobj, file.filename or "")
+    except Exception as e:
+        fileobj.close()
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    
+    return StreamingResponse(
+        stream_import(BulkImporter(db), source, skip, fileobj),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/admin/export")
+async def export_database(
+    request: Request,
+    format: str = "ndjson",
+    snapshot: bool = False,
+    db: AsyncClient = Depends(get_db)
+):
+    """流式导出分类、商品（含图片和点赞数）和评论
+
+    snapshot=1 时同时在 SNAPSHOT_DIR 中保存一份 gzip 快照，可以在管理面板中恢复。
+    """
+    user = request.session.get("user")
+    if not user or not user.get("is_admin"):
+        return JSONResponse(status_code=403, content={"message": "Unauthorized"})
+    
+    if format not in FORMATS:
+        return JSONResponse(status_code=400, content={"message": f"Unsupported format: {format}"})
+    
+    filename = f"catalog-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        export_catalog(db, format, snapshot),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/admin/snapshots/{name}/restore")
+async def restore_snapshot(request: Request, name: str, db: AsyncClient = Depends(get_db)):
+    """从导出的快照恢复数据，已存在的商品和评论按 source_key 更新"""
+    user = request.session.get("user")
+    if not user or not user.get("is_admin"):
+        return JSONResponse(status_code=403, content={"message": "Unauthorized"})
+    
+    path = snapshot_path(name)
+    if path is None:
+        return JSONResponse(status_code=404, content={"message": "Snapshot not found"})
+    
+    fileobj = open(path, "rb")
+    return StreamingResponse(
+        stream_import(BulkImporter(db), FileSource(fileobj, name), fileobj=fileobj),
+        media_type="application/x-ndjson"
+    )
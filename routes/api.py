@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi import APIRouter, Request, HTTPException, Depends, Query
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from database import get_db
-from supabase import Client
+from supabase import AsyncClient
+from utils.cache import catalog_cache, invalidate_item, invalidate_item_page
+from utils.catalog import get_item_listing, get_like_state, get_comment_page
+from utils import catalog
+from utils.write_behind import write_behind
+from utils.image_uploader import image_uploader
+from utils.search import search_index
+from utils.popularity import popularity
 
 router = APIRouter(prefix="/api")
 
+def check_admin(request: Request):
+    user = request.session.get("user")
+    if not user or not user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return user
+
 class CommentCreate(BaseModel):
     commenter_name: str
     content: str
@@ -16,7 +29,7 @@ async def create_comment(
     request: Request,
     item_id: int,
     comment: CommentCreate,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     comment_data = {
         "item_id": item_id,
@@ -33,71 +46,126 @@ async def create_comment(
         if "username" in user:
             comment_data["username"] = user["username"]
     
-    result = db.from_("comments").insert(comment_data).execute()
-    return result.data[0]
+    # 启用延迟写入时先放进队列，由后台任务批量写入
+    if write_behind.enabled:
+        comment = write_behind.add_comment(comment_data)
+    else:
+        result = await db.from_("comments").insert(comment_data).execute()
+        comment = result.data[0]
+    
+    invalidate_item_page(item_id)
+    return comment
+
+@router.get("/items/{item_id}/comments")
+async def list_comments(item_id: int, cursor: str = None, db: AsyncClient = Depends(get_db)):
+    """分页获取评论（商品页“加载更多”使用），第一页由服务端渲染"""
+    try:
+        return await get_comment_page(db, item_id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/items/{item_id}/likes")
-async def get_likes(item_id: int, db: Client = Depends(get_db)):
-    likes = db.from_("likes").select("id").eq("item_id", item_id).execute()
-    return {"likes_count": len(likes.data)}
+async def get_likes(request: Request, item_id: int, db: AsyncClient = Depends(get_db)):
+    """点赞数及当前 IP 是否已点赞（商品页加载后请求，页面本身可以被缓存）"""
+    ip_address = request.client.host
+    likes_count, liked = await get_like_state(db, item_id, ip_address)
+    if write_behind.enabled:
+        liked, likes_count = write_behind.like_overlay(item_id, ip_address, liked, likes_count)
+    return {"likes_count": likes_count, "liked": liked}
 
 @router.post("/items/{item_id}/likes")
 async def toggle_like(
     request: Request,
     item_id: int,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     ip_address = request.client.host
     
-    # 检查是否已经点赞
-    existing_like = db.from_("likes") \
-        .select("id") \
-        .eq("item_id", item_id) \
-        .eq("ip_address", ip_address) \
-        .execute()
-    
-    if existing_like.data:
-        # 如果已经点赞，则取消点赞
-        db.from_("likes") \
-            .delete() \
-            .eq("id", existing_like.data[0]["id"]) \
-            .execute()
-        return {"liked": False}
-    
-    # 如果未点赞，则添加点赞
-    like_data = {
-        "item_id": item_id,
-        "ip_address": ip_address,
-        "created_at": datetime.utcnow().isoformat()
-    }
-    db.from_("likes").insert(like_data).execute()
-    return {"liked": True}
+    # 切换点赞状态（数据库端原子操作，或放进延迟写入队列）
+    if write_behind.enabled:
+        liked, likes_count = await write_behind.toggle_like(db, item_id, ip_address)
+    else:
+        liked, likes_count = await catalog.toggle_like(db, item_id, ip_address)
+    return {"liked": liked, "likes_count": likes_count}
 
 @router.post("/items/{item_id}/toggle_sold")
 async def toggle_sold_status(
     request: Request,
     item_id: int,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     if "user" not in request.session or not request.session["user"].get("is_admin"):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # 获取当前状态
-    item = db.from_("items").select("is_sold").eq("id", item_id).execute()
+    item = await db.from_("items").select("is_sold").eq("id", item_id).execute()
     if not item.data:
         raise HTTPException(status_code=404, detail="Item not found")
     
     # 切换状态
     current_status = item.data[0]["is_sold"]
-    db.from_("items").update({"is_sold": not current_status}).eq("id", item_id).execute()
+    await db.from_("items").update({"is_sold": not current_status}).eq("id", item_id).execute()
+    invalidate_item(item_id, counts=False)
+    search_index.update({"id": item_id, "is_sold": not current_status})
     
     return {"status": "success"}
 
+@router.get("/items")
+async def list_items(category_id: int = None, cursor: str = None, sort: str = None, db: AsyncClient = Depends(get_db)):
+    """分页获取物品列表（首页无限滚动使用），sort=popular 时按热度排序"""
+    try:
+        if sort == "popular":
+            return await popularity.get_listing(db, category_id, cursor)
+        return await catalog_cache.get_or_load(
+            ("items", category_id, cursor), lambda: get_item_listing(db, category_id, cursor)
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/search")
+async def search_items(
+    q: str = "",
+    min_price: float = None,
+    max_price: float = None,
+    condition: str = None,
+    is_sold: bool = None,
+    category_id: int = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncClient = Depends(get_db)
+):
+    """全文搜索商品（进程内倒排索引，不查询数据库）"""
+    await search_index.ensure_built(db)
+    return {
+        "items": search_index.search(
+            q, min_price=min_price, max_price=max_price, condition=condition,
+            is_sold=is_sold, category_id=category_id, limit=limit
+        )
+    }
+
 @router.get("/categories")
-async def get_categories(db: Client = Depends(get_db)):
+async def get_categories(db: AsyncClient = Depends(get_db)):
     """获取所有分类"""
     try:
-        result = db.from_("categories").select("*").order("name").execute()
-        return result.data
+        return await catalog_cache.get_or_load(("categories", "by_name"), lambda: _load_categories(db))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _load_categories(db: AsyncClient) -> list:
+    result = await db.from_("categories").select("*").order("name").execute()
+    return result.data
+
+@router.get("/cache/stats", dependencies=[Depends(check_admin)])
+async def cache_stats():
+    """缓存命中统计（仅管理员）"""
+    return catalog_cache.stats()
+
+@router.get("/uploads/stats", dependencies=[Depends(check_admin)])
+async def upload_stats():
+    """图片上传耗时和失败统计（仅管理员）"""
+    return image_uploader.stats()
+
+@router.get("/popularity/stats", dependencies=[Depends(check_admin)])
+async def popularity_stats():
+    """浏览量批量写入和热度排行状态（仅管理员）"""
+    return popularity.stats()
@@ -3,9 +3,11 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 import secrets
 from database import get_db
+from utils.static_assets import static_assets
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
 
 # 从环境变量或配置文件获取
 ADMIN_USERNAME = "admin"
@@ -1,114 +1,146 @@
-import time
+import asyncio
 from fastapi import APIRouter, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from database import get_db
-from supabase import Client
+from supabase import AsyncClient
 from utils.template_filters import format_datetime
-from datetime import datetime
+from utils.catalog import get_categories_with_counts, get_item_listing, get_item_detail, get_comment_page, toggle_like
+from utils.cache import catalog_cache, page_cache
+from utils.middleware import make_etag, etag_matches
+from utils.write_behind import write_behind
+from utils.static_assets import static_assets
+from utils.search import search_index
+from utils.visit_tracker import visit_tracker
+from utils.popularity import popularity
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
 templates.env.filters["format_datetime"] = format_datetime
 
+async def render_cached(request: Request, render) -> Response:
+    """匿名访问者的整页缓存
+
+    按路径和查询参数缓存渲染好的 HTML 和 ETag；已登录用户（管理员）不走缓存。
+    If-None-Match 命中时直接返回 304，不查询也不渲染。
+    """
+    if request.session.get("user"):
+        return await render()
+    
+    async def load():
+        response = await render()
+        return response.body, make_etag(response.body)
+    
+    body, etag = await page_cache.get_or_load((request.url.path, request.url.query), load)
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return HTMLResponse(body, headers={"ETag": etag})
+
 @router.get("/", response_class=HTMLResponse)
-async def home(request: Request, category_id: int = None, db: Client = Depends(get_db)):
-    s1 = time.time()
-    print(s1)
-    
+async def home(request: Request, category_id: int = None, cursor: str = None, sort: str = None,
+               db: AsyncClient = Depends(get_db)):
+    # 在页面缓存之前计数，缓存命中和 304 也算一次浏览
+    visit_tracker.increment_page_view("home")
+    return await render_cached(request, lambda: render_home(request, category_id, cursor, db, sort))
+
+@router.get("/item/{item_id}")
+async def item_detail(request: Request, item_id: int, db: AsyncClient = Depends(get_db)):
+    visit_tracker.increment_page_view("item")
+    popularity.record_view(item_id)
+    return await render_cached(request, lambda: render_item_detail(request, item_id, db))
+
+@router.get("/search", response_class=HTMLResponse)
+async def search(
+    request: Request,
+    q: str = "",
+    min_price: float = None,
+    max_price: float = None,
+    condition: str = None,
+    sold: str = None,
+    category_id: int = None,
+    db: AsyncClient = Depends(get_db)
+):
+    """搜索结果页，复用首页模板"""
+    await search_index.ensure_built(db)
+    categories = await catalog_cache.get_or_load(
+        ("categories", "counts"), lambda: get_categories_with_counts(db)
+    )
+    # sold: 空 = 全部，"0" = 只看在售，"1" = 只看已售
+    is_sold = {"0": False, "1": True}.get(sold)
+    items = search_index.search(
+        q, min_price=min_price, max_price=max_price, condition=condition or None,
+        is_sold=is_sold, category_id=category_id, limit=100
+    )
+
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "items": [{**item, "first_image": item.get("cover_image_url")} for item in items],
+            "next_cursor": None,
+            "categories": categories,
+            "user": request.session.get("user"),
+            "current_category": category_id,
+            "search": {
+                "q": q,
+                "min_price": min_price,
+                "max_price": max_price,
+                "condition": condition or "",
+                "sold": sold or ""
+            }
+        }
+    )
+
+async def render_home(request: Request, category_id: int, cursor: str, db: AsyncClient, sort: str = None):
     # 获取用户信息
     user = request.session.get("user")
     
     # 获取分类列表和每个分类的物品数量
-    categories = db.from_("categories").select("*").execute()
-    
-    # 获取每个分类的物品数量
-    category_counts = {}
-    for category in categories.data:
-        count = db.from_("items").select("id", count="exact").eq("category_id", category["id"]).execute()
-        category_counts[category["id"]] = count.count
-    
-    # 添加物品数量到分类数据中
-    for category in categories.data:
-        category["item_count"] = category_counts.get(category["id"], 0)
-    
-    # 构建查询
-    query = db.from_("items").select("id, title, description, price, is_sold, category_id")
-    if category_id:
-        query = query.eq("category_id", category_id)
-    
-    # 按照未售出优先排序，然后按ID倒序
-    items = query.order("is_sold", nullsfirst=True).order("id", desc=True).execute()
-    
-    # 获取所有物品的ID列表
-    item_ids = [item["id"] for item in items.data]
-    
-    # 批量获取图片和点赞数
-    if item_ids:
-        # 获取每个物品的第一张图片
-        images = db.from_("item_images") \
-            .select("item_id, image_url") \
-            .in_("item_id", item_ids) \
-            .execute()
-        
-        # 创建图片映射 {item_id: first_image_url}
-        image_map = {}
-        for img in images.data:
-            if img["item_id"] not in image_map:
-                image_map[img["item_id"]] = img["image_url"]
-        
-        # 批量获取点赞数
-        likes = db.from_("likes") \
-            .select("item_id, id") \
-            .in_("item_id", item_ids) \
-            .execute()
-        
-        # 创建点赞数映射 {item_id: likes_count}
-        likes_map = {}
-        for like in likes.data:
-            likes_map[like["item_id"]] = likes_map.get(like["item_id"], 0) + 1
-    else:
-        image_map = {}
-        likes_map = {}
+    categories = await catalog_cache.get_or_load(
+        ("categories", "counts"), lambda: get_categories_with_counts(db)
+    )
     
-    # 处理物品数据
-    for item in items.data:
-        item["first_image"] = image_map.get(item["id"])
-        item["likes_count"] = likes_map.get(item["id"], 0)
+    # 获取当前页的物品列表（含首图和点赞数）
+    try:
+        if sort == "popular":
+            page = await popularity.get_listing(db, category_id, cursor)
+        else:
+            page = await catalog_cache.get_or_load(
+                ("items", category_id, cursor), lambda: get_item_listing(db, category_id, cursor)
+            )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    print(time.time()-s1)
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
-            "items": items.data,
-            "categories": categories.data,
+            "items": page["items"],
+            "next_cursor": page["next_cursor"],
+            "categories": categories,
             "user": user,
-            "current_category": category_id
+            "current_category": category_id,
+            "current_sort": sort if sort == "popular" else None
         }
     )
 
-@router.get("/item/{item_id}")
-async def item_detail(request: Request, item_id: int, db: Client = Depends(get_db)):
+async def render_item_detail(request: Request, item_id: int, db: AsyncClient):
     # 获取用户信息
     user = request.session.get("user")
-    ip_address = request.client.host
     
-    # 获取商品详情、图片和评论
-    query = db.from_("items").select("*, categories(name)").eq("id", item_id).execute()
-    if not query.data:
+    # 并行获取商品详情、图片和第一页评论；点赞状态因 IP 而异，由页面加载后单独请求
+    item, comment_page = await asyncio.gather(
+        catalog_cache.get_or_load(("item", item_id), lambda: get_item_detail(db, item_id)),
+        get_comment_page(db, item_id)
+    )
+    if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    item = query.data[0]
-    
-    # 并行获取图片、评论和点赞信息
-    images = db.from_("item_images").select("*").eq("item_id", item_id).execute()
-    comments = db.from_("comments").select("*").eq("item_id", item_id).order("created_at", desc=True).execute()
-    likes = db.from_("likes").select("id").eq("item_id", item_id).execute()
-    user_like = db.from_("likes").select("id").eq("item_id", item_id).eq("ip_address", ip_address).execute()
-    
-    # 添加图片到物品数据
-    item["images"] = images.data
+    # 叠加尚未写入数据库的评论（它们总是最新的，只出现在第一页）
+    comments = comment_page["comments"]
+    if write_behind.enabled:
+        comments = write_behind.pending_comments(item_id) + comments
     
     return templates.TemplateResponse(
         "item_detail.html",
@@ -116,9 +148,8 @@ async def item_detail(request: Request, item_id: int, db: Client = Depends(get_d
             "request": request,
             "item": item,
             "user": user,
-            "comments": comments.data,
-            "likes_count": len(likes.data),
-            "user_liked": len(user_like.data) > 0
+            "comments": comments,
+            "next_comment_cursor": comment_page["next_cursor"]
         }
     )
 
@@ -126,7 +157,7 @@ async def item_detail(request: Request, item_id: int, db: Client = Depends(get_d
 async def like_item(
     request: Request,
     item_id: int,
-    db: Client = Depends(get_db)
+    db: AsyncClient = Depends(get_db)
 ):
     # 获取用户信息
     user = request.session.get("user")
@@ -134,30 +165,16 @@ async def like_item(
         return JSONResponse(status_code=401, content={"message": "Unauthorized"})
     
     try:
-        # 检查是否已经点赞
-        existing_like = db.from_("likes").select("*").eq("item_id", item_id).eq("user_id", user["id"]).execute()
-        
-        if existing_like.data:
-            # 如果已经点赞，则取消点赞
-            db.from_("likes").delete().eq("item_id", item_id).eq("user_id", user["id"]).execute()
-            is_liked = False
+        # 切换点赞状态（数据库端原子操作，或放进延迟写入队列）
+        if write_behind.enabled:
+            is_liked, likes_count = await write_behind.toggle_like(db, item_id, request.client.host)
         else:
-            # 如果没有点赞，则添加点赞
-            db.from_("likes").insert({
-                "item_id": item_id,
-                "user_id": user["id"],
-                "ip_address": request.client.host,
-                "created_at": datetime.datetime.utcnow().isoformat()
-            }).execute()
-            is_liked = True
-        
-        # 获取最新的点赞数
-        likes_count = db.from_("likes").select("*", count="exact").eq("item_id", item_id).execute()
+            is_liked, likes_count = await toggle_like(db, item_id, request.client.host)
         
         return JSONResponse(content={
             "success": True,
             "is_liked": is_liked,
-            "likes_count": likes_count.count
+            "likes_count": likes_count
         })
     except Exception as e:
         return JSONResponse(status_code=500, content={"message": str(e)})
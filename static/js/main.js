@@ -1,3 +1,27 @@
+// 更新点赞按钮状态
+function renderLikeState(liked, count) {
+    const likeButton = document.getElementById('likeButton');
+    const likesCount = document.getElementById('likesCount');
+    
+    if (liked) {
+        likeButton.classList.remove('btn-outline-danger');
+        likeButton.classList.add('btn-danger');
+    } else {
+        likeButton.classList.remove('btn-danger');
+        likeButton.classList.add('btn-outline-danger');
+    }
+    likesCount.textContent = count;
+}
+
+// 加载当前访问者的点赞状态（商品页 HTML 会被缓存，不包含该信息）
+async function loadLikeState(itemId) {
+    const response = await fetch(`/api/items/${itemId}/likes`);
+    if (response.ok) {
+        const data = await response.json();
+        renderLikeState(data.liked, data.likes_count);
+    }
+}
+
 // 点赞功能
 async function toggleLike(itemId) {
     const response = await fetch(`/api/items/${itemId}/likes`, {
@@ -8,21 +32,9 @@ async function toggleLike(itemId) {
     });
     
     const data = await response.json();
-    const likeButton = document.getElementById('likeButton');
-    const likesCount = document.getElementById('likesCount');
-    
-    if (data.liked) {
-        likeButton.classList.remove('btn-outline-danger');
-        likeButton.classList.add('btn-danger');
-    } else {
-        likeButton.classList.remove('btn-danger');
-        likeButton.classList.add('btn-outline-danger');
-    }
     
-    // 更新点赞数
-    const countResponse = await fetch(`/api/items/${itemId}/likes`);
-    const countData = await countResponse.json();
-    likesCount.textContent = countData.likes_count;
+    // 更新点赞数（切换接口直接返回最新点赞数）
+    renderLikeState(data.liked, data.likes_count);
 }
 
 // 评论功能
@@ -97,6 +109,27 @@ async function toggleSoldStatus(itemId) {
     }
 }
 
+// 实时访问统计，断开后按指数退避重连
+function connectVisitStats(container, delay = 1000) {
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocol}://${window.location.host}/ws/stats`);
+
+    socket.addEventListener('open', () => {
+        delay = 1000;
+    });
+    socket.addEventListener('message', event => {
+        const stats = JSON.parse(event.data);
+        container.querySelectorAll('[data-stat]').forEach(el => {
+            if (stats[el.dataset.stat] !== undefined) {
+                el.textContent = stats[el.dataset.stat];
+            }
+        });
+    });
+    socket.addEventListener('close', () => {
+        setTimeout(() => connectVisitStats(container, Math.min(delay * 2, 30000)), delay);
+    });
+}
+
 // 当页面加载完成时设置事件监听器
 document.addEventListener('DOMContentLoaded', function() {
     // 点赞功能
@@ -219,17 +252,17 @@ document.addEventListener('DOMContentLoaded', function() {
         imageInput.addEventListener('change', previewImage);
     }
 
-    // 设置评论表单监听器
-    const commentForm = document.getElementById('commentForm');
-    if (commentForm) {
-        commentForm.addEventListener('submit', submitComment);
-    }
-    
     // 设置点赞按钮监听器
     const likeButton = document.getElementById('likeButton');
     if (likeButton) {
         const itemId = likeButton.dataset.itemId;
         likeButton.addEventListener('click', () => toggleLike(itemId));
+        loadLikeState(itemId);
+    }
+
+    const visitStats = document.getElementById('visitStats');
+    if (visitStats) {
+        connectVisitStats(visitStats);
     }
     
     // 设置图片上传监听器
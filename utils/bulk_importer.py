@@ -0,0 +1,392 @@
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+import posixpath
+import threading
+import frontmatter
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from fastapi import UploadFile
+from pydantic import ValidationError
+from supabase import AsyncClient
+from models.category import CategoryCreate
+from models.bulk_import import CommentImport, ItemImport
+from utils.cache import invalidate_item, invalidate_categories
+from utils.search import search_index
+from utils.storage import save_upload
+
+# 每次写入数据库的记录数
+BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# 进度中最多保留的错误信息条数
+MAX_ERRORS = 100
+IMAGE_RE = re.compile(r"!\[.*?\]\((.*?)\)")
+TEXT_SUFFIXES = (".md", ".csv", ".ndjson", ".jsonl", ".json")
+
+def row_key(record: dict) -> str:
+    """没有 source_key 的记录按内容生成，重复导入同一个文件时不会产生重复商品"""
+    fields = [record.get(name) for name in ("title", "category", "price", "description")]
+    return "row:" + hashlib.sha1(json.dumps(fields, default=str).encode()).hexdigest()
+
+def parse_markdown(text: str, source_key: str, base: str) -> dict:
+    """解析带 front matter 的 Markdown 商品文件
+
+    front matter 提供 title、price、condition、category 等字段，正文作为描述，
+    正文中的图片引用 ![](...) 作为商品图片。
+    """
+    post = frontmatter.loads(text)
+    record = dict(post.metadata)
+    if not record.get("source_key"):
+        record["source_key"] = source_key
+    record.setdefault("description", IMAGE_RE.sub("", post.content).strip())
+    images = list(record.get("images") or []) + IMAGE_RE.findall(post.content)
+    record["images"] = images
+    record["_base"] = base
+    return record
+
+def parse_csv(stream) -> Iterator[dict]:
+    """CSV 每行一个商品，images 列中的多个图片用 | 分隔"""
+    for row in csv.DictReader(stream):
+        row = {key.strip(): value for key, value in row.items() if key}
+        images = row.pop("images", "") or ""
+        row["images"] = [image.strip() for image in images.split("|") if image.strip()]
+        if not row.get("new_price"):
+            row.pop("new_price", None)
+        yield row
+
+def parse_ndjson(stream) -> Iterator[dict]:
+    """每行一个 JSON 对象，空行忽略"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def parse_json(stream) -> Iterator[dict]:
+    """JSON 数组，或 {"categories": [...], "items": [...]}"""
+    data = json.load(stream)
+    if isinstance(data, dict):
+        for category in data.get("categories", []):
+            yield {"type": "category", **category}
+        data = data.get("items", [])
+    yield from data
+
+def parse_text_file(name: str, binary) -> Iterator[dict]:
+    """按扩展名解析一个数据文件，.gz 结尾时先解压"""
+    if name.endswith(".gz"):
+        binary = gzip.GzipFile(fileobj=binary)
+        name = name[:-3]
+    stream = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    if name.endswith(".csv"):
+        return parse_csv(stream)
+    if name.endswith((".ndjson", ".jsonl")):
+        return parse_ndjson(stream)
+    if name.endswith(".json"):
+        return parse_json(stream)
+    raise ValueError(f"Unsupported file type: {name}")
+
+class ImportSource:
+    """导入数据的来源：逐条产生原始记录，并按相对路径读取其中的图片"""
+
+    def records(self) -> Iterator[dict]:
+        raise NotImplementedError
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        return None
+
+    def close(self):
+        pass
+
+class DirectorySource(ImportSource):
+    """服务器上的商品目录，每个 .md 文件一个商品"""
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+
+    def records(self) -> Iterator[dict]:
+        for dirpath, _, filenames in sorted(os.walk(self.root)):
+            for filename in sorted(filenames):
+                if not filename.endswith(".md"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                relpath = os.path.relpath(path, self.root).replace(os.sep, "/")
+                with open(path, encoding="utf-8") as f:
+                    yield parse_markdown(f.read(), f"md:{relpath}", posixpath.dirname(relpath))
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        # 不允许引用目录之外的文件
+        if not full_path.startswith(self.root + os.sep) or not os.path.isfile(full_path):
+            return None
+        with open(full_path, "rb") as f:
+            return f.read()
+
+class ArchiveSource(ImportSource):
+    """zip 或 tar(.gz) 包，包含 Markdown、CSV、NDJSON 文件以及它们引用的图片"""
+
+    def __init__(self, fileobj, filename: str):
+        if filename.endswith(".zip"):
+            self._zip = zipfile.ZipFile(fileobj)
+            self._tar = None
+            names = [name for name in self._zip.namelist() if not name.endswith("/")]
+        else:
+            self._zip = None
+            self._tar = tarfile.open(fileobj=fileobj, mode="r:*")
+            self._members = {member.name: member for member in self._tar.getmembers() if member.isfile()}
+            names = list(self._members)
+        # 规范化的路径（去掉 ./ 等）-> 包内的原始名称
+        self._names = {posixpath.normpath(name): name for name in names}
+        # 同一批的图片在多个线程中读取，而 TarFile 共享一个文件位置，不是线程安全的
+        self._read_lock = threading.Lock()
+
+    def _open(self, name: str):
+        name = self._names[name]
+        if self._zip is not None:
+            return self._zip.open(name)
+        return self._tar.extractfile(self._members[name])
+
+    def records(self) -> Iterator[dict]:
+        for name in sorted(self._names):
+            data_name = name[:-3] if name.endswith(".gz") else name
+            if posixpath.basename(name).startswith(".") or not data_name.endswith(TEXT_SUFFIXES):
+                continue
+            if name.endswith(".md"):
+                with self._open(name) as f:
+                    yield parse_markdown(f.read().decode("utf-8"), f"md:{name}", posixpath.dirname(name))
+            else:
+                with self._open(name) as f:
+                    yield from parse_text_file(name, f)
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        path = posixpath.normpath(path)
+        if path not in self._names:
+            return None
+        with self._read_lock, self._open(path) as f:
+            return f.read()
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+class FileSource(ImportSource):
+    """单个 CSV / NDJSON / JSON 文件（可以是 .gz 压缩的）"""
+
+    def __init__(self, fileobj, filename: str):
+        self.fileobj = fileobj
+        self.filename = filename
+
+    def records(self) -> Iterator[dict]:
+        yield from parse_text_file(self.filename, self.fileobj)
+
+def open_source(fileobj, filename: str) -> ImportSource:
+    """根据文件名选择解析方式，不支持的类型抛出 ValueError"""
+    filename = filename.lower()
+    if filename.endswith((".zip", ".tar", ".tar.gz", ".tgz")):
+        return ArchiveSource(fileobj, filename)
+    if filename.endswith(tuple(s + ".gz" for s in TEXT_SUFFIXES) + TEXT_SUFFIXES) and not filename.endswith(".md"):
+        return FileSource(fileobj, filename)
+    raise ValueError(f"Unsupported file type: {filename}")
+
+def _take(records: Iterator[dict], size: int) -> List[dict]:
+    return list(islice(records, size))
+
+class BulkImporter:
+    """批量导入商品、分类和图片
+
+    记录先用 models.category 和 models.bulk_import 中的模型校验，然后每 batch_size 条一起写入：
+    缺少的分类一次插入，商品按 source_key 一次 upsert，图片一次 upsert。
+    同一个文件重复导入只会更新已有商品，中断后可以直接重新导入，
+    也可以用 skip 跳过已经完成的记录。
+    """
+
+    def __init__(self, db: AsyncClient, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.categories: Dict[str, int] = {}
+        # 已导入商品的 source_key -> id，评论按它关联商品
+        self.item_ids: Dict[str, int] = {}
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[str] = []
+
+    def progress(self, **extra) -> dict:
+        return {
+            "processed": self.processed,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors[-10:],
+            **extra
+        }
+
+    def _error(self, message: str):
+        self.failed += 1
+        self._warn(message)
+
+    def _warn(self, message: str):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    async def run(self, source: ImportSource, skip: int = 0) -> AsyncIterator[dict]:
+        """执行导入，每写完一批产生一条进度"""
+        result = await self.db.table("categories").select("id, name").execute()
+        self.categories = {row["name"]: row["id"] for row in result.data}
+
+        records = source.records()
+        try:
+            if skip:
+                # 读取和丢弃也放到线程里，避免阻塞事件循环
+                skipped = await asyncio.to_thread(lambda: sum(1 for _ in islice(records, skip)))
+                self.processed = skipped
+                yield self.progress(skipped=skipped)
+
+            while True:
+                try:
+                    batch = await asyncio.to_thread(_take, records, self.batch_size)
+                except (ValueError, KeyError, csv.Error) as e:
+                    # 文件本身无法继续解析
+                    self._error(f"Parse error after record {self.processed}: {e}")
+                    break
+                if not batch:
+                    break
+                await self._import_batch(source, batch)
+                yield self.progress()
+        finally:
+            invalidate_item()
+            invalidate_categories()
+
+        yield self.progress(done=True)
+
+    async def _import_batch(self, source: ImportSource, batch: List[dict]):
+        items: Dict[str, ItemImport] = {}
+        bases: Dict[str, str] = {}
+        new_categories: Dict[str, CategoryCreate] = {}
+        comments: Dict[str, CommentImport] = {}
+
+        for record in batch:
+            self.processed += 1
+            record_type = record.pop("type", "item")
+            try:
+                if record_type == "category":
+                    category = CategoryCreate.model_validate(record)
+                    if category.name not in self.categories:
+                        new_categories[category.name] = category
+                    continue
+                if record_type == "comment":
+                    comment = CommentImport.model_validate(record)
+                    comments[comment.source_key] = comment
+                    continue
+                if record_type != "item":
+                    continue
+                base = record.pop("_base", "")
+                # CSV 中空的 source_key 列是 ""，同样按内容生成
+                if not record.get("source_key"):
+                    record["source_key"] = row_key(record)
+                item = ItemImport.model_validate(record)
+            except ValidationError as e:
+                self._error(f"Record {self.processed}: {e.errors()[0]['loc']} {e.errors()[0]['msg']}")
+                continue
+            # 同一批中重复的 source_key 以最后一条为准
+            items[item.source_key] = item
+            bases[item.source_key] = base
+            if item.category not in self.categories:
+                new_categories.setdefault(item.category, CategoryCreate(name=item.category))
+
+        if new_categories:
+            result = await self.db.table("categories").insert(
+                [category.model_dump() for category in new_categories.values()]
+            ).execute()
+            self.categories.update({row["name"]: row["id"] for row in result.data})
+
+        if items:
+            await self._import_items(source, items, bases)
+        if comments:
+            await self._import_comments(comments)
+
+    async def _import_items(self, source: ImportSource, items: Dict[str, ItemImport], bases: Dict[str, str]):
+        # 导入包里的图片并发保存，URL 原样引用
+        images = await asyncio.gather(*(
+            self._resolve_images(source, item, bases[key]) for key, item in items.items()
+        ))
+        images = dict(zip(items, images))
+
+        rows = []
+        for key, item in items.items():
+            # 批量 upsert 要求每行的列一致，new_price 为空时写入 NULL
+            row = item.model_dump(exclude={"category", "images"})
+            row["category_id"] = self.categories[item.category]
+            row["cover_image_url"] = images[key][0]["card_url"] if images[key] else None
+            rows.append(row)
+
+        try:
+            result = await self.db.table("items").upsert(rows, on_conflict="source_key").execute()
+        except Exception as e:
+            for _ in rows:
+                self._error(f"Batch ending at record {self.processed}: {e}")
+            return
+
+        image_rows = []
+        for item in result.data:
+            search_index.upsert(item)
+            for image in images.get(item["source_key"], []):
+                image_rows.append({"item_id": item["id"], **image})
+        if image_rows:
+            await self.db.table("item_images") \
+                .upsert(image_rows, on_conflict="item_id,image_url", ignore_duplicates=True) \
+                .execute()
+        self.imported += len(result.data)
+        self.item_ids.update({item["source_key"]: item["id"] for item in result.data})
+
+    async def _import_comments(self, comments: Dict[str, CommentImport]):
+        """恢复快照中的评论，已存在的评论（source_key 相同）忽略"""
+        missing = list({c.item_source_key for c in comments.values()} - set(self.item_ids))
+        if missing:
+            result = await self.db.table("items").select("id, source_key").in_("source_key", missing).execute()
+            self.item_ids.update({row["source_key"]: row["id"] for row in result.data})
+
+        rows = []
+        for comment in comments.values():
+            item_id = self.item_ids.get(comment.item_source_key)
+            if item_id is None:
+                self._error(f"{comment.source_key}: item not found: {comment.item_source_key}")
+                continue
+            row = comment.model_dump(mode="json", exclude={"item_source_key"})
+            row["item_id"] = item_id
+            row["created_at"] = row["created_at"] or datetime.utcnow().isoformat()
+            rows.append(row)
+        if rows:
+            await self.db.table("comments") \
+                .upsert(rows, on_conflict="source_key", ignore_duplicates=True) \
+                .execute()
+            self.imported += len(rows)
+
+    async def _resolve_images(self, source: ImportSource, item: ItemImport, base: str) -> List[dict]:
+        resolved = []
+        for image in item.images:
+            if isinstance(image, dict):
+                # 导出文件中的图片记录
+                url = image.get("image_url")
+                if url:
+                    resolved.append({
+                        "image_url": url,
+                        "thumb_url": image.get("thumb_url") or url,
+                        "card_url": image.get("card_url") or url,
+                        "content_hash": image.get("content_hash")
+                    })
+                continue
+            if image.startswith(("http://", "https://", "/")):
+                resolved.append({"image_url": image, "thumb_url": image, "card_url": image, "content_hash": None})
+                continue
+
+            path = posixpath.join(base, image)
+            data = await asyncio.to_thread(source.read_file, path)
+            if data is None:
+                self._warn(f"{item.source_key}: image not found: {image}")
+                continue
+            resolved.append(await save_upload(UploadFile(file=io.BytesIO(data), filename=posixpath.basename(path))))
+        return resolved
@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class TTLCache:
+    """带过期时间和 LRU 淘汰的进程内缓存
+
+    键是元组，第一个元素为命名空间，例如 ("item", 12)、("items", None)。
+    可以按完整键失效，也可以让整个命名空间失效。
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[Tuple, asyncio.Task] = {}
+        # 每次失效时递增，防止失效前发起的加载把旧数据写回缓存
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回 default"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Tuple, value: Any, ttl: float = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """读取缓存，未命中时调用 loader 加载
+
+        同一个键的并发未命中只会触发一次加载。加载在独立的任务中运行，
+        所有调用方都通过 shield 等待它，某个调用方被取消不会影响其他调用方。
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        pending = self._loading.get(key)
+        if pending is None:
+            pending = self._loading[key] = asyncio.ensure_future(self._load(key, loader))
+            # 所有调用方都被取消时避免 "exception was never retrieved" 警告
+            pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(pending)
+
+    async def _load(self, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        version = self.version
+        try:
+            value = await loader()
+            if version == self.version:
+                self.set(key, value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    def invalidate(self, namespace: Hashable, *args):
+        """使缓存失效
+
+        只给命名空间时删除该命名空间下的所有键，否则删除以 (namespace, *args) 开头的键。
+        """
+        prefix = (namespace,) + args
+        for key in [k for k in self._data if k[:len(prefix)] == prefix]:
+            del self._data[key]
+        self.version += 1
+        self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+        self.version += 1
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        """命中率等统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60"))
+)
+
+# 匿名访问者的整页缓存，键为 (路径, 查询字符串)
+page_cache = TTLCache(
+    maxsize=int(os.getenv("PAGE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "30"))
+)
+
+def invalidate_item(item_id: int = None, counts: bool = True):
+    """商品新增、修改、删除后调用
+
+    counts 为 False 时表示分类下的商品数量不变（例如只切换售出状态）。
+    """
+    catalog_cache.invalidate("items")
+    page_cache.invalidate("/")
+    if counts:
+        catalog_cache.invalidate("categories")
+    if item_id is not None:
+        catalog_cache.invalidate("item", item_id)
+        page_cache.invalidate(f"/item/{item_id}")
+
+def invalidate_item_page(item_id: int):
+    """商品页内容（例如评论）变化后调用"""
+    page_cache.invalidate(f"/item/{item_id}")
+
+def invalidate_categories():
+    """分类新增、修改、删除后调用（所有页面都包含分类名称）"""
+    catalog_cache.invalidate("categories")
+    catalog_cache.invalidate("item")
+    page_cache.clear()
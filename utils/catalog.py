@@ -0,0 +1,150 @@
+import base64
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from supabase import AsyncClient
+
+async def get_categories_with_counts(db: AsyncClient) -> list:
+    """获取所有分类及每个分类的商品数量（单次查询）"""
+    result = await db.from_("categories_with_counts").select("*").execute()
+    return result.data
+
+async def get_like_state(db: AsyncClient, item_id: int, ip_address: str) -> tuple:
+    """获取商品点赞数及该 IP 是否已点赞（单次查询）"""
+    result = await db.rpc("get_like_state", {
+        "p_item_id": item_id,
+        "p_ip_address": ip_address
+    }).execute()
+    if not result.data:
+        return 0, False
+    state = result.data[0]
+    return state["likes_count"], state["user_liked"]
+
+# 首页每页显示的物品数量
+PAGE_SIZE = 24
+
+def encode_item_cursor(item: dict) -> str:
+    """根据一页最后一个物品生成分页游标，格式为 <is_sold>-<id>"""
+    return f"{int(bool(item['is_sold']))}-{item['id']}"
+
+def decode_item_cursor(cursor: str) -> tuple:
+    """解析分页游标，格式错误时抛出 ValueError"""
+    sold, item_id = cursor.split("-", 1)
+    if sold not in ("0", "1"):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return sold == "1", int(item_id)
+
+async def get_item_listing(db: AsyncClient, category_id: int = None, cursor: str = None, limit: int = PAGE_SIZE) -> dict:
+    """获取首页的一页物品，附带每个物品的封面图和点赞数
+
+    按 (is_sold, id desc) 做 keyset 分页，返回 {"items": [...], "next_cursor": ...}。
+    封面图和点赞数都是 items 上的冗余列，整页只需一次查询。
+    """
+    # 构建查询
+    query = db.from_("items").select("id, title, description, price, is_sold, category_id, cover_image_url, likes_count")
+    if category_id:
+        query = query.eq("category_id", category_id)
+    if cursor:
+        is_sold, last_id = decode_item_cursor(cursor)
+        sold = "true" if is_sold else "false"
+        query = query.or_(f"is_sold.gt.{sold},and(is_sold.eq.{sold},id.lt.{last_id})")
+    
+    # 按照未售出优先排序，然后按ID倒序；多取一条用来判断是否还有下一页
+    items = await query.order("is_sold").order("id", desc=True).limit(limit + 1).execute()
+    has_more = len(items.data) > limit
+    del items.data[limit:]
+    
+    # 处理物品数据
+    for item in items.data:
+        item["first_image"] = item.pop("cover_image_url")
+    
+    return {
+        "items": items.data,
+        "next_cursor": encode_item_cursor(items.data[-1]) if has_more else None
+    }
+
+# 商品页每次显示的评论数量
+COMMENT_PAGE_SIZE = 20
+# 模板只需要这些列
+COMMENT_FIELDS = "id, commenter_name, content, created_at"
+
+def encode_comment_cursor(comment: dict) -> str:
+    """根据一页最后一条评论生成游标（created_at 中含 + 和 :，所以做 base64 编码）"""
+    raw = f"{comment['created_at']}|{comment['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_comment_cursor(cursor: str) -> tuple:
+    """解析评论游标，返回 (created_at, id)，格式错误时抛出 ValueError
+
+    created_at 会拼进 PostgREST 的 or 过滤条件，所以先解析成 datetime 再重新序列化，
+    游标里的其他内容无法进入查询。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, comment_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at).isoformat(), int(comment_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+async def get_comment_page(db: AsyncClient, item_id: int, cursor: str = None, limit: int = COMMENT_PAGE_SIZE) -> dict:
+    """获取商品的一页评论，按 (created_at, id) 倒序做 keyset 分页
+
+    返回 {"comments": [...], "next_cursor": ...}。
+    """
+    query = db.from_("comments").select(COMMENT_FIELDS).eq("item_id", item_id)
+    if cursor:
+        created_at, last_id = decode_comment_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})'
+        )
+    
+    comments = await query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    has_more = len(comments.data) > limit
+    del comments.data[limit:]
+    
+    return {
+        "comments": comments.data,
+        "next_cursor": encode_comment_cursor(comments.data[-1]) if has_more else None
+    }
+
+async def get_item_detail(db: AsyncClient, item_id: int) -> Optional[dict]:
+    """获取商品详情（含分类名称和全部图片），商品不存在时返回 None"""
+    query, images = await asyncio.gather(
+        db.from_("items").select("*, categories(name)").eq("id", item_id).execute(),
+        db.from_("item_images").select("*").eq("item_id", item_id).execute()
+    )
+    if not query.data:
+        return None
+    
+    item = query.data[0]
+    item["images"] = images.data
+    return item
+
+async def delete_item_cascade(db: AsyncClient, item_id: int) -> Optional[List[dict]]:
+    """在一个事务中删除商品及其图片、评论和点赞
+
+    返回不再被引用、可以删除的图片文件记录；商品不存在时返回 None。
+    """
+    result = await db.rpc("delete_item_cascade", {"p_item_id": item_id}).execute()
+    state = result.data[0]
+    if not state["deleted"]:
+        return None
+    return state["files"]
+
+async def delete_item_images(db: AsyncClient, item_id: int, image_ids: List[int]) -> tuple:
+    """删除商品的部分图片并重新计算封面，返回 (新封面 URL, 可以删除的图片文件记录)"""
+    result = await db.rpc("delete_item_images", {
+        "p_item_id": item_id,
+        "p_image_ids": image_ids
+    }).execute()
+    state = result.data[0]
+    return state["cover_image_url"], state["files"]
+
+async def toggle_like(db: AsyncClient, item_id: int, ip_address: str) -> tuple:
+    """原子地切换点赞状态，返回 (是否已点赞, 最新点赞数)"""
+    result = await db.rpc("toggle_like", {
+        "p_item_id": item_id,
+        "p_ip_address": ip_address
+    }).execute()
+    state = result.data[0]
+    return state["liked"], state["likes_count"] or 0
@@ -0,0 +1,246 @@
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Optional
+
+class CounterBackend:
+    """计数器存储后端
+
+    counters 是累加值（总访问量、页面浏览量），gauges 是每个进程各自上报的当前值
+    （在线人数），读取时把仍然存活的进程的值相加。
+    """
+
+    async def add(self, deltas: Dict[str, int]):
+        raise NotImplementedError
+
+    async def set_gauges(self, worker: str, gauges: Dict[str, int]):
+        raise NotImplementedError
+
+    async def read(self, max_age: float) -> Dict[str, int]:
+        """返回所有计数器和最近 max_age 秒内上报过的 gauge 之和"""
+        raise NotImplementedError
+
+    async def remove_worker(self, worker: str):
+        pass
+
+    async def close(self):
+        pass
+
+class MemoryCounterBackend(CounterBackend):
+    """进程内存储，单进程部署或开发时使用，重启后清零"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Dict[str, tuple]] = {}
+
+    async def add(self, deltas: Dict[str, int]):
+        for name, delta in deltas.items():
+            self.counters[name] = self.counters.get(name, 0) + delta
+
+    async def set_gauges(self, worker: str, gauges: Dict[str, int]):
+        now = time.time()
+        for name, value in gauges.items():
+            self.gauges.setdefault(name, {})[worker] = (value, now)
+
+    async def read(self, max_age: float) -> Dict[str, int]:
+        values = dict(self.counters)
+        cutoff = time.time() - max_age
+        for name, workers in self.gauges.items():
+            values[name] = sum(value for value, updated_at in workers.values() if updated_at >= cutoff)
+        return values
+
+    async def remove_worker(self, worker: str):
+        for workers in self.gauges.values():
+            workers.pop(worker, None)
+
+class SqliteCounterBackend(CounterBackend):
+    """同一台机器上多个 worker 共享的 SQLite 文件（WAL 模式）
+
+    sqlite3 是阻塞调用，全部放到线程里执行，不阻塞事件循环。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gauges ("
+                "name TEXT NOT NULL, worker TEXT NOT NULL, value INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (name, worker))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(self._connect(), *args)
+
+    @staticmethod
+    def _add(conn: sqlite3.Connection, deltas: Dict[str, int]):
+        with conn:
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(deltas.items())
+            )
+
+    @staticmethod
+    def _set_gauges(conn: sqlite3.Connection, worker: str, gauges: Dict[str, int]):
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT INTO gauges (name, worker, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name, worker) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(name, worker, value, now) for name, value in gauges.items()]
+            )
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, max_age: float) -> Dict[str, int]:
+        values = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        values.update(conn.execute(
+            "SELECT name, SUM(value) FROM gauges WHERE updated_at >= ? GROUP BY name",
+            (time.time() - max_age,)
+        ).fetchall())
+        return values
+
+    @staticmethod
+    def _remove_worker(conn: sqlite3.Connection, worker: str):
+        with conn:
+            conn.execute("DELETE FROM gauges WHERE worker = ?", (worker,))
+
+    async def add(self, deltas: Dict[str, int]):
+        await asyncio.to_thread(self._run, self._add, deltas)
+
+    async def set_gauges(self, worker: str, gauges: Dict[str, int]):
+        await asyncio.to_thread(self._run, self._set_gauges, worker, gauges)
+
+    async def read(self, max_age: float) -> Dict[str, int]:
+        return await asyncio.to_thread(self._run, self._read, max_age)
+
+    async def remove_worker(self, worker: str):
+        await asyncio.to_thread(self._run, self._remove_worker, worker)
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class Counters:
+    """批量写入的计数器
+
+    incr 只修改内存中的增量，后台任务每隔 flush_interval 秒把增量合并写入后端，
+    同时上报本进程的 gauge 并读回所有进程的汇总值。页面浏览不会产生额外的数据库写入。
+    """
+
+    def __init__(self, backend: CounterBackend, flush_interval: float = 2.0):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._pending: Dict[str, int] = {}
+        self._gauges: Dict[str, int] = {}
+        # 本进程最近一次写入后端的 gauge 值
+        self._reported: Dict[str, int] = {}
+        # 最近一次从后端读回的汇总值
+        self._snapshot: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.errors = 0
+
+    def incr(self, name: str, amount: int = 1):
+        self._pending[name] = self._pending.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: int):
+        self._gauges[name] = value
+
+    def get(self, name: str) -> int:
+        """汇总值加上本进程尚未写入的增量"""
+        if name in self._gauges:
+            # 快照里已包含本进程上次上报的值，用当前值替换
+            reported = self._reported.get(name, 0)
+            return self._snapshot.get(name, reported) - reported + self._gauges[name]
+        return self._snapshot.get(name, 0) + self._pending.get(name, 0)
+
+    async def flush(self):
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            gauges = dict(self._gauges)
+            try:
+                if pending:
+                    await self.backend.add(pending)
+                    pending = {}
+                if gauges:
+                    await self.backend.set_gauges(self.worker, gauges)
+                    self._reported.update(gauges)
+                # 超过 3 个周期没有上报的进程视为已退出
+                self._snapshot = await self.backend.read(max_age=self.flush_interval * 3)
+                self.flushes += 1
+            except Exception as e:
+                # 写入失败时把增量放回，下次再试
+                for name, delta in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + delta
+                self.errors += 1
+                print(f"计数器写入失败: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """读取已有的计数并启动后台写入任务（在应用 lifespan 中调用）"""
+        await self.flush()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务，写入剩余增量并注销本进程的 gauge"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        try:
+            await self.backend.remove_worker(self.worker)
+        except Exception as e:
+            print(f"计数器写入失败: {str(e)}")
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.worker,
+            "backend": type(self.backend).__name__,
+            "pending": dict(self._pending),
+            "flushes": self.flushes,
+            "errors": self.errors
+        }
+
+def create_backend(name: str) -> CounterBackend:
+    """按名称创建后端：memory / sqlite"""
+    if name == "memory":
+        return MemoryCounterBackend()
+    if name == "sqlite":
+        return SqliteCounterBackend(os.getenv("COUNTER_DB_PATH", "data/counters.db"))
+    raise ValueError(f"未知的计数器后端: {name}")
+
+counters = Counters(
+    create_backend(os.getenv("COUNTER_BACKEND", "sqlite")),
+    flush_interval=float(os.getenv("COUNTER_FLUSH_SECONDS", "2"))
+)
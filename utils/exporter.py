@@ -0,0 +1,213 @@
+import io
+import os
+import csv
+import gzip
+import json
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+from supabase import AsyncClient
+
+# 每次从数据库读取的商品数（图片和评论也按这个大小翻页），不能超过 PostgREST 的 max-rows（Supabase 默认 1000）
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+# 快照目录不在 static 下，不会被公开访问
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+ITEM_FIELDS = "id, source_key, title, description, price, new_price, condition, category_id, is_sold, likes_count, created_at"
+IMAGE_FIELDS = "id, item_id, image_url, thumb_url, card_url, content_hash"
+COMMENT_FIELDS = "id, source_key, item_id, commenter_name, username, content, created_at"
+CSV_COLUMNS = [
+    "source_key", "id", "title", "description", "price", "new_price", "condition", "category",
+    "is_sold", "likes_count", "comments_count", "created_at", "images"
+]
+
+async def iter_children(db: AsyncClient, table: str, fields: str, item_ids: List[int],
+                        page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[dict]]:
+    """按 id 做 keyset 分页读取一批商品的图片或评论
+
+    一次 in_ 查询的结果会被 PostgREST 的 max-rows 静默截断，所以一直翻页到返回的行数少于 page_size。
+    """
+    last_id = 0
+    while True:
+        page = await db.from_(table) \
+            .select(fields) \
+            .in_("item_id", item_ids) \
+            .gt("id", last_id) \
+            .order("id") \
+            .limit(page_size) \
+            .execute()
+        if len(page.data) < page_size:
+            if page.data:
+                yield page.data
+            return
+        last_id = page.data[-1]["id"]
+        yield page.data
+
+async def iter_catalog(db: AsyncClient, page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[dict]]:
+    """按页读取整个目录，每页产生一组 NDJSON 记录
+
+    第一页是所有分类，之后是一批商品（带图片），然后是这些商品的评论（每页最多 page_size 条）。
+    商品、图片和评论都按 id 做 keyset 分页，内存占用只和 page_size 有关。
+    """
+    result = await db.from_("categories").select("id, name, description").order("id").execute()
+    categories = {row["id"]: row["name"] for row in result.data}
+    yield [{"type": "category", **row} for row in result.data]
+
+    last_id = 0
+    while True:
+        page = await db.from_("items") \
+            .select(ITEM_FIELDS) \
+            .gt("id", last_id) \
+            .order("id") \
+            .limit(page_size) \
+            .execute()
+        if not page.data:
+            return
+
+        item_ids = [item["id"] for item in page.data]
+        images_by_item: Dict[int, List[dict]] = {}
+        async for images in iter_children(db, "item_images", IMAGE_FIELDS, item_ids, page_size):
+            for image in images:
+                image.pop("id")
+                images_by_item.setdefault(image.pop("item_id"), []).append(image)
+        source_keys = {item["id"]: item["source_key"] or f"item:{item['id']}" for item in page.data}
+
+        yield [
+            {
+                "type": "item",
+                **item,
+                "source_key": source_keys[item["id"]],
+                "category": categories.get(item["category_id"]),
+                "images": images_by_item.get(item["id"], [])
+            }
+            for item in page.data
+        ]
+
+        # 评论在商品之后，导入时可以按 item_source_key 找到商品
+        async for comments in iter_children(db, "comments", COMMENT_FIELDS, item_ids, page_size):
+            yield [
+                {
+                    "type": "comment",
+                    **comment,
+                    "source_key": comment["source_key"] or f"comment:{comment['id']}",
+                    "item_source_key": source_keys[comment["item_id"]]
+                }
+                for comment in comments
+            ]
+
+        if len(page.data) < page_size:
+            return
+        last_id = page.data[-1]["id"]
+
+def to_ndjson(records: List[dict]) -> str:
+    return "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+
+class CsvEncoder:
+    """把商品记录转成 CSV 行（每个商品一行，列与导入的 CSV 格式兼容）
+
+    一批商品的评论在后面的记录中，所以商品先暂存，等下一批商品到来或 finish 时才写出，
+    这时评论数已经统计完。
+    """
+
+    def __init__(self):
+        self.header_written = False
+        self._items: List[dict] = []
+        self._comments_count: Dict[str, int] = {}
+
+    def _flush(self) -> str:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        if not self.header_written:
+            writer.writeheader()
+            self.header_written = True
+        for item in self._items:
+            writer.writerow({
+                **item,
+                "comments_count": self._comments_count.get(item["source_key"], 0),
+                "images": "|".join(image["image_url"] for image in item["images"])
+            })
+        self._items, self._comments_count = [], {}
+        return buffer.getvalue()
+
+    def encode(self, records: List[dict]) -> str:
+        # 新一批商品到来时，上一批的评论已经全部统计过
+        data = ""
+        if self._items and any(record["type"] == "item" for record in records):
+            data = self._flush()
+        for record in records:
+            if record["type"] == "item":
+                self._items.append(record)
+            elif record["type"] == "comment":
+                key = record["item_source_key"]
+                self._comments_count[key] = self._comments_count.get(key, 0) + 1
+        return data
+
+    def finish(self) -> str:
+        return self._flush()
+
+class Snapshot:
+    """导出时同时写入的 gzip 快照，写完后才改成正式文件名，避免留下半个文件"""
+
+    def __init__(self, fmt: str, directory: str = SNAPSHOT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.name = f"catalog-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}.gz"
+        self.path = os.path.join(directory, self.name)
+        self._tmp_path = self.path + ".tmp"
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8", newline="")
+
+    async def write(self, data: str):
+        await asyncio.to_thread(self._file.write, data)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+async def export_catalog(db: AsyncClient, fmt: str = "ndjson", snapshot: bool = False) -> AsyncIterator[str]:
+    """流式导出，可以直接作为 StreamingResponse 的内容；snapshot 为 True 时同时写入快照文件"""
+    encoder = CsvEncoder() if fmt == "csv" else None
+    encode = encoder.encode if encoder is not None else to_ndjson
+    snapshot = Snapshot(fmt) if snapshot else None
+    try:
+        async for records in iter_catalog(db):
+            data = encode(records)
+            if not data:
+                continue
+            if snapshot is not None:
+                await snapshot.write(data)
+            yield data
+        if encoder is not None:
+            data = encoder.finish()
+            if snapshot is not None:
+                await snapshot.write(data)
+            yield data
+    except BaseException:
+        # 包括客户端中途断开，快照不完整时删除
+        if snapshot is not None:
+            snapshot.abort()
+        raise
+    if snapshot is not None:
+        snapshot.commit()
+
+def list_snapshots(directory: str = SNAPSHOT_DIR) -> List[dict]:
+    """已完成的快照，最新的在前"""
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith("catalog-") and name.endswith(".gz"):
+            path = os.path.join(directory, name)
+            snapshots.append({"name": name, "size": os.path.getsize(path)})
+    return sorted(snapshots, key=lambda s: s["name"], reverse=True)
+
+def snapshot_path(name: str, directory: str = SNAPSHOT_DIR) -> Optional[str]:
+    """按文件名找到快照，不允许访问目录之外的文件"""
+    if name != os.path.basename(name) or not name.startswith("catalog-"):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
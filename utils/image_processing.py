@@ -0,0 +1,57 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+
+# 变体名称 -> 最长边像素
+VARIANTS = {
+    "thumb": 200,
+    "card": 600,
+    "full": 1600
+}
+WEBP_QUALITY = 80
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", "2")))
+    return _pool
+
+def make_variants(path: str) -> Dict[str, str]:
+    """为图片生成各尺寸的 WebP 变体，返回 {变体名称: 文件路径}
+
+    在进程池中运行。重新编码时不写入 EXIF，拍摄位置等元数据会被去掉。
+    """
+    stem = os.path.splitext(path)[0]
+    variants = {}
+    with Image.open(path) as original:
+        # 先按 EXIF 方向旋转，否则去掉 EXIF 后手机照片会横过来
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for name, size in VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            variant_path = f"{stem}_{name}.webp"
+            variant.save(variant_path, "WEBP", quality=WEBP_QUALITY, method=4)
+            variants[name] = variant_path
+    return variants
+
+async def process_image(path: str) -> Optional[Dict[str, str]]:
+    """在进程池中生成图片变体，不是有效图片时返回 None"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), make_variants, path)
+    except Exception as e:
+        print(f"Error processing image {path}: {str(e)}")
+        return None
+
+def shutdown():
+    """关闭进程池（在应用 lifespan 结束时调用）"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -1,44 +1,267 @@
 import os
-import requests
-from typing import Optional
+import hmac
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import aiofiles
+import httpx
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import quote, urlparse
+
+class UploadError(Exception):
+    """上传失败且不应重试（例如认证失败、文件被拒绝）"""
+
+class RetryableUploadError(UploadError):
+    """临时性的上传失败（超时、5xx、限流），可以重试"""
+
+class UploadBackend:
+    """图床后端接口，子类实现 upload 并返回图片的公开 URL"""
+
+    name = "base"
+
+    async def upload(self, client: httpx.AsyncClient, filename: str, data: bytes, content_type: str) -> str:
+        raise NotImplementedError
+
+def _raise_for_status(response: httpx.Response):
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableUploadError(f"Upload failed with status code: {response.status_code}")
+    if response.status_code >= 400:
+        raise UploadError(f"Upload failed with status code: {response.status_code}")
+
+class SmmsBackend(UploadBackend):
+    """SM.MS 图床"""
+
+    name = "smms"
+
+    def __init__(self, api_token: str, api_url: str = "https://sm.ms/api/v2/upload"):
+        self.api_token = api_token
+        self.api_url = api_url
+
+    async def upload(self, client, filename, data, content_type):
+        response = await client.post(
+            self.api_url,
+            headers={"Authorization": self.api_token},
+            files={"smfile": (filename, data, content_type)}
+        )
+        _raise_for_status(response)
 
-class ImageUploader:
-    @staticmethod
-    async def upload_image(file) -> Optional[str]:
-        """
-        Upload an image to SM.MS and return the URL
-        """
         try:
-            # 获取API密钥    API_KEY = os.getenv("SMMS_API_KEY", "wLVadsW6aYifPtuZUWrCh4cyTsdNilnh")  # 从环境变量获取API密钥
-
-            api_token = os.getenv("SMMS_API_KEY", "wLVadsW6aYifPtuZUWrCh4cyTsdNilnh")
-            if not api_token:
-                print("Warning: SMMS_API_KEY not set")
-                return None
-            
-            # 准备上传
-            headers = {'Authorization': api_token}
-            files = {'smfile': file.file}
-            
-            # 发送请求
-            response = requests.post(
-                'https://sm.ms/api/v2/upload',
-                headers=headers,
-                files=files
+            result = response.json()
+        except ValueError:
+            raise UploadError("Upload failed: invalid JSON response")
+        if not isinstance(result, dict):
+            raise UploadError("Upload failed: unexpected response")
+        if result.get("success"):
+            return result["data"]["url"]
+        # 同一张图片已经上传过时 SM.MS 返回已有的地址
+        if result.get("code") == "image_repeated" and result.get("images"):
+            return result["images"]
+        raise UploadError(f"Upload failed: {result.get('message')}")
+
+class LocalBackend(UploadBackend):
+    """保存到本地 static 目录"""
+
+    name = "local"
+
+    def __init__(self, directory: str = "static/uploads", url_prefix: str = "/static/uploads"):
+        self.directory = directory
+        self.url_prefix = url_prefix
+
+    async def upload(self, client, filename, data, content_type):
+        name = f"{uuid.uuid4()}{os.path.splitext(filename)[1]}"
+        async with aiofiles.open(os.path.join(self.directory, name), "wb") as buffer:
+            await buffer.write(data)
+        return f"{self.url_prefix}/{name}"
+
+class S3Backend(UploadBackend):
+    """S3 兼容的对象存储（AWS S3、MinIO、Cloudflare R2 等），使用 SigV4 签名的 PUT"""
+
+    name = "s3"
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", public_url: str = None, prefix: str = "uploads"):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.public_url = (public_url or f"{self.endpoint}/{bucket}").rstrip("/")
+        self.prefix = prefix
+
+    def _signed_headers(self, path: str, data: bytes, content_type: str) -> Dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        payload_hash = hashlib.sha256(data).hexdigest()
+        headers = {
+            "content-type": content_type,
+            "host": urlparse(self.endpoint).netloc,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date
+        }
+
+        signed_headers = ";".join(sorted(headers))
+        canonical_headers = "".join(f"{name}:{headers[name]}\n" for name in sorted(headers))
+        canonical_request = "\n".join([
+            "PUT", quote(path, safe="/-_.~"), "", canonical_headers, signed_headers, payload_hash
+        ])
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+
+        key = ("AWS4" + self.secret_key).encode()
+        for part in (date_stamp, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        del headers["host"]
+        return headers
+
+    async def upload(self, client, filename, data, content_type):
+        object_key = f"{self.prefix}/{uuid.uuid4()}{os.path.splitext(filename)[1]}"
+        path = f"{urlparse(self.endpoint).path}/{self.bucket}/{object_key}"
+        response = await client.put(
+            f"{self.endpoint}/{self.bucket}/{object_key}",
+            content=data,
+            headers=self._signed_headers(path, data, content_type)
+        )
+        _raise_for_status(response)
+        return f"{self.public_url}/{object_key}"
+
+class UploadMetrics:
+    """上传次数、失败次数和耗时统计"""
+
+    def __init__(self):
+        self.uploads = 0
+        self.failures = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    def record(self, seconds: float, ok: bool, error: str = None):
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if ok:
+            self.uploads += 1
+        else:
+            self.failures += 1
+            self.last_error = error
+
+    def as_dict(self) -> dict:
+        attempts = self.uploads + self.failures
+        return {
+            "uploads": self.uploads,
+            "failures": self.failures,
+            "retries": self.retries,
+            "avg_seconds": round(self.total_seconds / attempts, 4) if attempts else 0.0,
+            "max_seconds": round(self.max_seconds, 4),
+            "last_error": self.last_error
+        }
+
+class ImageUploader:
+    """异步图片上传器
+
+    所有上传共享一个带连接池的 httpx.AsyncClient，每次请求有超时，
+    并发数受信号量限制，临时错误按指数退避重试（退避期间不占用信号量）。
+    transport 用于在本地测试时替换网络层，例如 benchmarks/fake_image_host.py。
+    """
+
+    def __init__(self, backend: UploadBackend, timeout: float = 10.0, max_concurrency: int = 4,
+                 retries: int = 2, backoff: float = 0.5, transport: httpx.AsyncBaseTransport = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.metrics = UploadMetrics()
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2),
+                transport=self.transport
             )
-            
-            # 检查响应
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    return data['data']['url']
-                else:
-                    print(f"Upload failed: {data.get('message')}")
-                    return None
-            else:
-                print(f"Upload failed with status code: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"Error uploading image: {str(e)}")
-            return None
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def upload_image(self, file) -> Optional[str]:
+        """上传 FastAPI UploadFile，返回图片 URL，失败时返回 None"""
+        data = await file.read()
+        return await self.upload_bytes(data, file.filename or "image", file.content_type)
+
+    async def upload_bytes(self, data: bytes, filename: str, content_type: str = None) -> Optional[str]:
+        """上传图片内容，返回图片 URL，失败时返回 None"""
+        client = self._get_client()
+        content_type = content_type or "application/octet-stream"
+        started = time.monotonic()
+        error = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.metrics.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            try:
+                async with self._semaphore:
+                    url = await self.backend.upload(client, filename, data, content_type)
+                self.metrics.record(time.monotonic() - started, ok=True)
+                return url
+            except (RetryableUploadError, httpx.TransportError) as e:
+                error = str(e) or e.__class__.__name__
+            except (UploadError, httpx.HTTPError, ValueError, OSError) as e:
+                # 其他 httpx 错误、无法解析的响应、本地写文件失败都不重试
+                error = str(e) or e.__class__.__name__
+                break
+
+        print(f"Error uploading image: {error}")
+        self.metrics.record(time.monotonic() - started, ok=False, error=error)
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, **self.metrics.as_dict()}
+
+    async def aclose(self):
+        """关闭连接池（在应用 lifespan 结束时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+def create_backend(name: str) -> UploadBackend:
+    """根据 UPLOAD_BACKEND 环境变量创建图床后端"""
+    if name == "local":
+        return LocalBackend()
+    if name == "s3":
+        return S3Backend(
+            endpoint=os.environ["S3_ENDPOINT"],
+            bucket=os.environ["S3_BUCKET"],
+            access_key=os.environ["S3_ACCESS_KEY"],
+            secret_key=os.environ["S3_SECRET_KEY"],
+            region=os.getenv("S3_REGION", "us-east-1"),
+            public_url=os.getenv("S3_PUBLIC_URL")
+        )
+    if name == "smms":
+        return SmmsBackend(
+            api_token=os.getenv("SMMS_API_KEY", "wLVadsW6aYifPtuZUWrCh4cyTsdNilnh"),
+            api_url=os.getenv("SMMS_API_URL", "https://sm.ms/api/v2/upload")
+        )
+    raise ValueError(f"Unknown upload backend: {name}")
+
+image_uploader = ImageUploader(
+    create_backend(os.getenv("UPLOAD_BACKEND", "smms")),
+    timeout=float(os.getenv("UPLOAD_TIMEOUT", "10")),
+    max_concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+    retries=int(os.getenv("UPLOAD_RETRIES", "2"))
+)
@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+def make_etag(body: bytes) -> str:
+    """根据响应内容生成强 ETag"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """按弱比较规则判断 If-None-Match 是否命中"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+class CompressionMiddleware:
+    """HTML/JSON 响应的 ETag、条件请求和压缩
+
+    - 没有 ETag 的 GET 响应按内容计算 ETag，If-None-Match 命中时返回 304 不带正文
+    - 超过 minimum_size 的响应按 Accept-Encoding 使用 brotli 或 gzip 压缩
+    其他类型（静态文件、流式导出等）原样透传。
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024,
+                 content_types=("text/html", "application/json")):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        start_message: Message = None
+        passthrough = False
+        body = []
+
+        async def buffered_send(message: Message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if content_type not in self.content_types or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                await self._send_response(scope, request_headers, start_message, b"".join(body), send)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _send_response(self, scope: Scope, request_headers: Headers, start_message: Message,
+                             body: bytes, send: Send):
+        status = start_message["status"]
+        headers = MutableHeaders(raw=list(start_message["headers"]))
+
+        if scope["method"] in ("GET", "HEAD") and status == 200:
+            etag = headers.get("etag") or make_etag(body)
+            headers["etag"] = etag
+            if etag_matches(request_headers.get("if-none-match", ""), etag):
+                for name in ("content-length", "content-type"):
+                    if name in headers:
+                        del headers[name]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        encoding = self._choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding and len(body) >= self.minimum_size:
+            if encoding == "br":
+                body = brotli.compress(body, quality=5)
+            else:
+                body = gzip.compress(body, compresslevel=6)
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            # 压缩后的表示与原文不同，按惯例把强 ETag 改为弱 ETag
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                headers["etag"] = "W/" + headers["etag"]
+
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _choose_encoding(accept_encoding: str):
+        encodings = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+        if "br" in encodings:
+            return "br"
+        if "gzip" in encodings:
+            return "gzip"
+        return None
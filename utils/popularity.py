@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional
+from supabase import AsyncClient
+from utils.cache import catalog_cache
+from utils.search import search_index
+from utils.catalog import PAGE_SIZE
+
+POPULAR_CURSOR_PREFIX = "p:"
+
+def encode_popular_cursor(offset: int) -> str:
+    return f"{POPULAR_CURSOR_PREFIX}{offset}"
+
+def decode_popular_cursor(cursor: str) -> int:
+    """解析热门排序的游标，格式不正确时抛出 ValueError"""
+    if not cursor.startswith(POPULAR_CURSOR_PREFIX):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    offset = int(cursor[len(POPULAR_CURSOR_PREFIX):])
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset
+
+class PopularityTracker:
+    """商品浏览量和热度排行
+
+    商品页每次访问只在内存里加一，后台任务每隔 refresh_interval 秒把浏览量批量写入
+    item_stats（数据库中按半衰期对旧热度做指数衰减），然后读回热度最高的 ranking_size
+    个商品作为排行。首页的热门排序只读这份预先算好的排行。
+    """
+
+    def __init__(self, half_life: float = 86400, refresh_interval: float = 60, ranking_size: int = 1000):
+        self.half_life = half_life
+        self.refresh_interval = refresh_interval
+        self.ranking_size = ranking_size
+        self._pending: Dict[int, int] = {}
+        # 商品 ID -> 衰减到最近一次刷新时的热度
+        self.scores: Dict[int, float] = {}
+        self.refreshed_at: Optional[float] = None
+        self._db: Optional[AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+
+    def record_view(self, item_id: int):
+        self._pending[item_id] = self._pending.get(item_id, 0) + 1
+
+    async def flush(self, db: AsyncClient):
+        """把积累的浏览量一次写入数据库"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await db.rpc("record_item_views", {
+                "p_views": [{"item_id": item_id, "views": views} for item_id, views in pending.items()],
+                "p_half_life_seconds": self.half_life
+            }).execute()
+        except Exception as e:
+            print(f"浏览量写入失败: {str(e)}")
+            for item_id, views in pending.items():
+                self._pending[item_id] = self._pending.get(item_id, 0) + views
+
+    async def refresh(self, db: AsyncClient):
+        """写入浏览量并重新读取排行"""
+        async with self._refresh_lock:
+            await self.flush(db)
+            result = await db.rpc("get_popular_items", {
+                "p_half_life_seconds": self.half_life,
+                "p_limit": self.ranking_size
+            }).execute()
+            self.scores = {row["item_id"]: row["score"] for row in result.data}
+            self.refreshed_at = time.monotonic()
+            catalog_cache.invalidate("items", "popular")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh(self._db)
+            except Exception as e:
+                print(f"热度排行刷新失败: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self, db: AsyncClient):
+        """启动后台刷新任务（在应用 lifespan 中调用）"""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入剩余浏览量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            await self.flush(self._db)
+
+    def _ordered_ids(self, category_id: int = None) -> List[int]:
+        # 未售出优先，然后按热度，没有热度的按 ID 倒序排在后面
+        docs = [
+            doc for doc in search_index.docs.values()
+            if not category_id or doc.get("category_id") == category_id
+        ]
+        docs.sort(key=lambda doc: (bool(doc.get("is_sold")), -self.scores.get(doc["id"], 0), -doc["id"]))
+        return [doc["id"] for doc in docs]
+
+    async def get_listing(self, db: AsyncClient, category_id: int = None, cursor: str = None,
+                          limit: int = PAGE_SIZE) -> dict:
+        """按热度排序的一页商品，格式与 catalog.get_item_listing 相同
+
+        商品字段来自搜索索引，排好序的 ID 列表按分类缓存，翻页只做切片。
+        """
+        offset = decode_popular_cursor(cursor) if cursor else 0
+        await search_index.ensure_built(db)
+
+        async def load():
+            return self._ordered_ids(category_id)
+
+        ids = await catalog_cache.get_or_load(("items", "popular", category_id), load)
+
+        items = []
+        for item_id in ids[offset:offset + limit]:
+            doc = search_index.docs.get(item_id)
+            if doc is not None:
+                item = {**doc, "first_image": doc.get("cover_image_url")}
+                item.pop("cover_image_url", None)
+                items.append(item)
+
+        return {
+            "items": items,
+            "next_cursor": encode_popular_cursor(offset + limit) if offset + limit < len(ids) else None
+        }
+
+    def stats(self) -> dict:
+        return {
+            "pending_items": len(self._pending),
+            "ranked_items": len(self.scores),
+            "refreshed_seconds_ago": round(time.monotonic() - self.refreshed_at, 1) if self.refreshed_at else None
+        }
+
+popularity = PopularityTracker(
+    half_life=float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "24")) * 3600,
+    refresh_interval=float(os.getenv("POPULARITY_REFRESH_SECONDS", "60")),
+    ranking_size=int(os.getenv("POPULARITY_RANKING_SIZE", "1000"))
+)
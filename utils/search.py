@@ -0,0 +1,295 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from supabase import AsyncClient
+
+# 土耳其语字母折叠为 ASCII，大小写不敏感（I/ı/İ/i 都视为 i）
+TURKISH_FOLD = str.maketrans({
+    "ı": "i", "İ": "i", "I": "i",
+    "ş": "s", "Ş": "s",
+    "ğ": "g", "Ğ": "g",
+    "ü": "u", "Ü": "u",
+    "ö": "o", "Ö": "o",
+    "ç": "c", "Ç": "c"
+})
+TOKEN_RE = re.compile(r"\w+")
+# 被索引的字段，也是搜索结果返回的字段
+FIELDS = "id, title, description, price, condition, is_sold, category_id, cover_image_url, likes_count"
+PAGE_SIZE = 1000
+
+def fold(text: str) -> str:
+    """大小写和变音符号折叠：Işık -> isik、Çanta -> canta"""
+    text = unicodedata.normalize("NFKD", (text or "").translate(TURKISH_FOLD).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(fold(text))
+
+def _order_key(doc: dict) -> Tuple[bool, int]:
+    # 结果的默认顺序：未售出优先，然后按 ID 倒序
+    return bool(doc.get("is_sold")), -doc["id"]
+
+def _add_postings(postings: Dict[str, Set[int]], terms: List[str], item_id: int, words: Set[str]):
+    for word in words:
+        ids = postings.get(word)
+        if ids is None:
+            ids = postings[word] = set()
+            insort(terms, word)
+        ids.add(item_id)
+
+def _remove_postings(postings: Dict[str, Set[int]], terms: List[str], item_id: int, words: Set[str]):
+    for word in words:
+        ids = postings.get(word)
+        if ids is None:
+            continue
+        ids.discard(item_id)
+        if not ids:
+            del postings[word]
+            del terms[bisect_left(terms, word)]
+
+def _has_prefix(terms: List[str], prefix: str) -> bool:
+    """terms 是排好序的词项，判断其中是否有以 prefix 开头的"""
+    i = bisect_left(terms, prefix)
+    return i < len(terms) and terms[i].startswith(prefix)
+
+def _prefix_sets(postings: Dict[str, Set[int]], terms: List[str], prefix: str) -> List[Set[int]]:
+    """以 prefix 开头的所有词项的倒排集合（不合并，避免短前缀时构造大集合）"""
+    sets = []
+    i = bisect_left(terms, prefix)
+    while i < len(terms) and terms[i].startswith(prefix):
+        sets.append(postings[terms[i]])
+        i += 1
+    return sets
+
+class SearchIndex:
+    """商品标题和描述的进程内倒排索引
+
+    词项按土耳其语规则折叠，查询中的每个词按前缀匹配，多个词之间是 AND。
+    首次搜索时从数据库分页加载全部商品，之后由管理员路由增量更新；
+    多进程部署时每隔 refresh_interval 秒在后台重建一次，以同步其他进程的修改。
+    所有商品按结果的顺序维护一个有序列表，空查询和常见的前缀都沿着它取前 limit 个，
+    不需要给全部候选排序。
+    """
+
+    def __init__(self, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self.docs: Dict[int, dict] = {}
+        # 标题和描述的词项 -> 商品 ID；排好序的词项，用于前缀查找
+        self._postings: Dict[str, Set[int]] = {}
+        self._terms: List[str] = []
+        # 每个商品排好序的词项，用于逐个检查商品是否匹配
+        self._doc_terms: Dict[int, List[str]] = {}
+        # 按 _order_key 排好序的全部商品；批量构建时为 None，构建完成后一次排序
+        self._order: Optional[List[Tuple[bool, int]]] = []
+        self.built_at: Optional[float] = None
+        self._build_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # 重建期间的增量修改，替换索引后重放
+        self._changes: Optional[list] = None
+
+    def upsert(self, item: dict):
+        """新增或更新商品，item 是完整的商品行"""
+        if self._changes is not None:
+            self._changes.append(("upsert", item))
+        self._upsert(item)
+
+    def update(self, item: dict):
+        """只更新已在索引中的商品，item 可以只包含变化的字段（必须有 id）
+
+        索引中还没有的商品（例如在其他进程中新建的）忽略，下次重建时会加载完整的行。
+        """
+        if self._changes is not None:
+            self._changes.append(("update", item))
+        if item["id"] in self.docs:
+            self._upsert(item)
+
+    def remove(self, item_id: int):
+        """从索引中删除商品"""
+        if self._changes is not None:
+            self._changes.append(("remove", item_id))
+        self._remove(item_id)
+
+    def _upsert(self, item: dict):
+        item_id = item["id"]
+        old = self.docs.get(item_id)
+        doc = {**(old or {}), **item}
+        old_terms = set(self._doc_terms.get(item_id, ()))
+        new_terms = set(tokenize(doc.get("title", ""))) | set(tokenize(doc.get("description", "")))
+        _remove_postings(self._postings, self._terms, item_id, old_terms - new_terms)
+        _add_postings(self._postings, self._terms, item_id, new_terms - old_terms)
+        self._doc_terms[item_id] = sorted(new_terms)
+        self.docs[item_id] = doc
+
+        if self._order is not None and (old is None or _order_key(old) != _order_key(doc)):
+            if old is not None:
+                self._remove_order(old)
+            insort(self._order, _order_key(doc))
+
+    def _remove(self, item_id: int):
+        doc = self.docs.pop(item_id, None)
+        if doc is None:
+            return
+        _remove_postings(self._postings, self._terms, item_id, set(self._doc_terms.pop(item_id)))
+        if self._order is not None:
+            self._remove_order(doc)
+
+    def _remove_order(self, doc: dict):
+        key = _order_key(doc)
+        i = bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+
+    def _filter(self, min_price: float = None, max_price: float = None, condition: str = None,
+                is_sold: bool = None, category_id: int = None) -> Optional[Callable[[dict], bool]]:
+        """把过滤条件组合成一个函数，没有条件时返回 None"""
+        if min_price is None and max_price is None and not condition and is_sold is None and not category_id:
+            return None
+
+        def accept(doc: dict) -> bool:
+            if min_price is not None and (doc.get("price") or 0) < min_price:
+                return False
+            if max_price is not None and (doc.get("price") or 0) > max_price:
+                return False
+            if condition and doc.get("condition") != condition:
+                return False
+            if is_sold is not None and bool(doc.get("is_sold")) != is_sold:
+                return False
+            if category_id and doc.get("category_id") != category_id:
+                return False
+            return True
+
+        return accept
+
+    def search(self, query: str = "", min_price: float = None, max_price: float = None,
+               condition: str = None, is_sold: bool = None, category_id: int = None,
+               limit: int = 50) -> List[dict]:
+        """搜索商品，未售出的排在前面，然后按 ID 倒序"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        accept = self._filter(min_price, max_price, condition, is_sold, category_id)
+        if not tokens:
+            return self._walk([], accept, is_sold, limit)
+
+        # 每个词匹配的词项的倒排集合，匹配数（上界）最少的词决定候选集合
+        matches = [_prefix_sets(self._postings, self._terms, token) for token in tokens]
+        counts = [sum(map(len, sets)) for sets in matches]
+        smallest = min(range(len(tokens)), key=counts.__getitem__)
+        if not counts[smallest]:
+            return []
+
+        # 常见的前缀沿 _order 查找，通常检查几十个商品就够 limit 个；
+        # 检查的商品超过候选数、而剩下的商品比候选更多时，说明结果很少，
+        # 改为取出候选集合再选前 limit 个
+        checks = list(zip(tokens, matches))
+        if counts[smallest] ** 2 >= limit * len(self.docs):
+            results = self._walk(checks, accept, is_sold, limit, budget=counts[smallest])
+            if results is not None:
+                return results
+        return self._rank(checks, smallest, accept, limit)
+
+    def _matches(self, item_id: int, checks: List[Tuple[str, List[Set[int]]]]) -> bool:
+        for token, sets in checks:
+            if len(sets) <= 4:
+                if not any(item_id in ids for ids in sets):
+                    return False
+            # 匹配的词项很多（短前缀）时在商品自己的词项中二分查找
+            elif not _has_prefix(self._doc_terms[item_id], token):
+                return False
+        return True
+
+    def _walk(self, checks: List[Tuple[str, List[Set[int]]]], accept: Optional[Callable[[dict], bool]],
+              is_sold: Optional[bool], limit: int, budget: int = None) -> Optional[List[dict]]:
+        """沿 _order 逐个检查商品，凑够 limit 个结果就停止；检查超过 budget 个商品时返回 None"""
+        order = self._order
+        # 按售出状态过滤时只查找 _order 中对应的一段
+        split = bisect_left(order, (True, float("-inf")))
+        start, stop = (split, len(order)) if is_sold else (0, split) if is_sold is not None else (0, len(order))
+
+        if budget is not None and budget >= stop - start - budget:
+            budget = None
+        results = []
+        for i in range(start, stop):
+            if i - start == budget:
+                return None
+            item_id = -order[i][1]
+            doc = self.docs[item_id]
+            # 价格、分类等过滤条件比前缀检查便宜，先检查
+            if accept is not None and not accept(doc):
+                continue
+            if checks and not self._matches(item_id, checks):
+                continue
+            results.append(doc)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _rank(self, checks: List[Tuple[str, List[Set[int]]]], smallest: int,
+              accept: Optional[Callable[[dict], bool]], limit: int) -> List[dict]:
+        """取出最小的候选集合，逐个检查其余的词，再选出前 limit 个"""
+        others = checks[:smallest] + checks[smallest + 1:]
+        docs = []
+        for item_id in set().union(*checks[smallest][1]):
+            if others and not self._matches(item_id, others):
+                continue
+            doc = self.docs[item_id]
+            if accept is None or accept(doc):
+                docs.append(doc)
+        return heapq.nsmallest(limit, docs, key=_order_key)
+
+    async def _load(self, db: AsyncClient) -> Dict[int, dict]:
+        docs = {}
+        last_id = 0
+        while True:
+            page = await db.from_("items") \
+                .select(FIELDS) \
+                .gt("id", last_id) \
+                .order("id") \
+                .limit(PAGE_SIZE) \
+                .execute()
+            for item in page.data:
+                docs[item["id"]] = item
+            if len(page.data) < PAGE_SIZE:
+                return docs
+            last_id = page.data[-1]["id"]
+
+    async def build(self, db: AsyncClient):
+        """从数据库重建索引"""
+        async with self._build_lock:
+            self._changes = []
+            try:
+                docs = await self._load(db)
+                # 一次性替换，加载期间的查询仍使用旧索引
+                fresh = SearchIndex(self.refresh_interval)
+                fresh._order = None
+                for doc in docs.values():
+                    fresh.upsert(doc)
+                fresh._order = sorted(_order_key(doc) for doc in fresh.docs.values())
+                for method, arg in self._changes:
+                    getattr(fresh, method)(arg)
+                self.docs = fresh.docs
+                self._postings = fresh._postings
+                self._terms = fresh._terms
+                self._doc_terms = fresh._doc_terms
+                self._order = fresh._order
+                self.built_at = time.monotonic()
+            finally:
+                self._changes = None
+
+    async def ensure_built(self, db: AsyncClient):
+        """首次使用时同步加载；过期时在后台重建，不阻塞当前查询"""
+        if self.built_at is None:
+            if not self._build_lock.locked():
+                await self.build(db)
+            else:
+                async with self._build_lock:
+                    pass
+            return
+        stale = time.monotonic() - self.built_at > self.refresh_interval
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.build(db))
+
+search_index = SearchIndex(refresh_interval=float(os.getenv("SEARCH_REFRESH_SECONDS", "300")))
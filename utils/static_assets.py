@@ -0,0 +1,113 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import brotli
+from typing import Dict
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from utils.middleware import etag_matches
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# 需要预压缩的文本类型
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt")
+
+class StaticAssets:
+    """静态资源清单：为文件生成带内容哈希的文件名，并预先生成 gzip/brotli 版本
+
+    css/style.css -> css/style.3f2a9c1b.css，内容不变 URL 就不变，可以被浏览器永久缓存。
+    """
+
+    def __init__(self, directory: str = "static", fingerprint_dirs=("css", "js", "images")):
+        self.directory = directory
+        self.fingerprint_dirs = fingerprint_dirs
+        # 原始路径 -> 带哈希的路径
+        self.manifest: Dict[str, str] = {}
+        # 带哈希的路径 -> 原始路径
+        self.reverse: Dict[str, str] = {}
+        # 原始路径 -> 强 ETag
+        self.etags: Dict[str, str] = {}
+
+    def build(self):
+        """扫描静态目录，计算哈希并生成预压缩文件（应用启动时调用一次）"""
+        for subdir in self.fingerprint_dirs:
+            root = os.path.join(self.directory, subdir)
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if filename.endswith((".gz", ".br")):
+                        continue
+                    full_path = os.path.join(dirpath, filename)
+                    path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                    with open(full_path, "rb") as f:
+                        content = f.read()
+
+                    digest = hashlib.sha256(content).hexdigest()
+                    stem, ext = os.path.splitext(path)
+                    hashed = f"{stem}.{digest[:10]}{ext}"
+                    self.manifest[path] = hashed
+                    self.reverse[hashed] = path
+                    self.etags[path] = f'"{digest}"'
+
+                    if ext in COMPRESSIBLE:
+                        self._precompress(full_path, content)
+
+    def _precompress(self, full_path: str, content: bytes):
+        mtime = os.path.getmtime(full_path)
+        for suffix, compress in ((".gz", lambda data: gzip.compress(data, 9, mtime=0)),
+                                 (".br", lambda data: brotli.compress(data, quality=11))):
+            target = full_path + suffix
+            if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                continue
+            with open(target, "wb") as f:
+                f.write(compress(content))
+
+    def url(self, path: str) -> str:
+        """模板中使用：返回带哈希的静态资源 URL，不在清单中的文件原样返回"""
+        path = path.lstrip("/")
+        return f"/static/{self.manifest.get(path, path)}"
+
+class AssetStaticFiles(StaticFiles):
+    """在 StaticFiles 基础上支持带哈希的文件名、预压缩文件和长期缓存
+
+    带哈希的资源和上传目录（文件名本身就唯一）返回 Cache-Control: immutable。
+    """
+
+    def __init__(self, *, assets: StaticAssets, immutable_dirs=("uploads",), **kwargs):
+        super().__init__(**kwargs)
+        self.assets = assets
+        self.immutable_dirs = tuple(f"{d}/" for d in immutable_dirs)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        path = path.replace(os.sep, "/")
+        original = self.assets.reverse.get(path)
+        if original is None:
+            response = await super().get_response(path, scope)
+            if path.startswith(self.immutable_dirs) and response.status_code in (200, 304):
+                response.headers["Cache-Control"] = IMMUTABLE
+            return response
+
+        request_headers = Headers(scope=scope)
+        full_path = os.path.join(self.directory, original)
+        media_type = mimetypes.guess_type(original)[0] or "application/octet-stream"
+        etag = self.assets.etags[original]
+        headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+
+        # 先选定要返回的表示；强 ETag 必须区分不同的 Content-Encoding，所以每种压缩版本加后缀
+        accept_encoding = request_headers.get("accept-encoding", "")
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in accept_encoding and os.path.exists(full_path + suffix):
+                full_path += suffix
+                etag = f'{etag[:-1]}-{suffix[1:]}"'
+                headers["Content-Encoding"] = encoding
+                break
+        headers["ETag"] = etag
+
+        if etag_matches(request_headers.get("if-none-match", ""), etag):
+            # 304 不带正文，也不需要 Content-Encoding
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return FileResponse(full_path, media_type=media_type, headers=headers)
+
+static_assets = StaticAssets()
@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+import asyncio
+import weakref
+import hashlib
+import aiofiles
+import aiofiles.os
+from typing import List, Optional
+from fastapi import UploadFile
+from supabase import AsyncClient
+from utils.cache import TTLCache
+from utils.image_processing import process_image, VARIANTS
+
+UPLOAD_DIR = "static/uploads"
+# 每次从上传文件读取的字节数
+CHUNK_SIZE = 256 * 1024
+# 内容哈希 -> 锁，同样内容的文件同时上传时依次处理，后处理的直接复用已生成的变体
+_hash_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# save_upload 交出文件后，调用方要过一会儿才插入 item_images 行；
+# 这段时间内数据库里查不到引用，删除文件前至少等这么久
+REUSE_GRACE_SECONDS = 60
+# (内容哈希,) -> 最近一次交给调用方的时间
+_handed_out = TTLCache(maxsize=100000, ttl=REUSE_GRACE_SECONDS)
+
+def _hash_lock(content_hash: str) -> asyncio.Lock:
+    lock = _hash_locks.get(content_hash)
+    if lock is None:
+        lock = _hash_locks[content_hash] = asyncio.Lock()
+    return lock
+
+def _upload_url(path: str) -> str:
+    return f"/static/uploads/{os.path.basename(path)}"
+
+def _variant_path(content_hash: str, name: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{content_hash}_{name}.webp")
+
+def _image_row(content_hash: str, image_url: str, thumb_url: str, card_url: str) -> dict:
+    return {
+        "image_url": image_url,
+        "thumb_url": thumb_url,
+        "card_url": card_url,
+        "content_hash": content_hash
+    }
+
+async def save_upload(upload: UploadFile) -> dict:
+    """分块把上传的文件写入 static/uploads 并生成缩略图等变体
+
+    文件按内容的 SHA-256 命名，相同的图片只存一份，已经处理过的内容直接复用。
+    返回 item_images 行需要的 {"image_url", "thumb_url", "card_url", "content_hash"}。
+    生成变体成功后删除带 EXIF 的原图，image_url 指向大图变体；
+    不是有效图片时保留原文件，三个 URL 都指向它。
+    """
+    ext = os.path.splitext(upload.filename)[1].lower()
+    tmp_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4()}.tmp")
+
+    # 边写入边计算哈希
+    digest = hashlib.sha256()
+    async with aiofiles.open(tmp_path, "wb") as buffer:
+        while chunk := await upload.read(CHUNK_SIZE):
+            digest.update(chunk)
+            await buffer.write(chunk)
+    content_hash = digest.hexdigest()
+
+    async with _hash_lock(content_hash):
+        image = await _store(tmp_path, content_hash, ext)
+        _handed_out.set((content_hash,), time.monotonic())
+        return image
+
+async def _store(tmp_path: str, content_hash: str, ext: str) -> dict:
+    """把临时文件按内容哈希存储（调用方持有该哈希的锁）"""
+    # 同样的内容已经存在
+    variant_paths = {name: _variant_path(content_hash, name) for name in VARIANTS}
+    original_path = os.path.join(UPLOAD_DIR, f"{content_hash}{ext}")
+    if all(os.path.exists(path) for path in variant_paths.values()):
+        await aiofiles.os.remove(tmp_path)
+        return _image_row(
+            content_hash,
+            _upload_url(variant_paths["full"]),
+            _upload_url(variant_paths["thumb"]),
+            _upload_url(variant_paths["card"])
+        )
+    if os.path.exists(original_path):
+        await aiofiles.os.remove(tmp_path)
+        url = _upload_url(original_path)
+        return _image_row(content_hash, url, url, url)
+
+    await aiofiles.os.rename(tmp_path, original_path)
+    variants = await process_image(original_path)
+    if variants is None:
+        url = _upload_url(original_path)
+        return _image_row(content_hash, url, url, url)
+
+    await aiofiles.os.remove(original_path)
+    return _image_row(
+        content_hash,
+        _upload_url(variants["full"]),
+        _upload_url(variants["thumb"]),
+        _upload_url(variants["card"])
+    )
+
+async def save_uploads(uploads: Optional[List[UploadFile]]) -> List[dict]:
+    """并发保存多个上传文件，忽略空文件名，按上传顺序返回图片信息"""
+    return list(await asyncio.gather(
+        *(save_upload(upload) for upload in uploads or [] if upload.filename)
+    ))
+
+def remove_image_files(image: dict):
+    """删除一条 item_images 记录对应的原图和所有变体文件"""
+    urls = {image.get("image_url"), image.get("thumb_url"), image.get("card_url")}
+    for url in urls:
+        # 只删除上传目录中的文件（导入的商品可能引用外部 URL 或其他静态文件）
+        if not url or not url.startswith("/static/uploads/"):
+            continue
+        file_path = os.path.join(os.path.dirname(__file__), "..", url.lstrip("/"))
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+async def remove_unreferenced_files(db: AsyncClient, images: List[dict]):
+    """批量删除已不再被引用的图片文件（在响应发送后的后台任务中执行）
+
+    图片记录由数据库函数删除并返回孤立的文件，但同样内容的文件可能已被另一个请求复用、
+    只是还没插入 item_images 行。所以持有与 save_upload 相同的哈希锁，
+    等最近一次复用过去 REUSE_GRACE_SECONDS 之后重新查询引用，确实没有引用才删除。
+    """
+    for image in images:
+        try:
+            await _remove_if_unreferenced(db, image)
+        except Exception as e:
+            print(f"删除图片文件失败: {str(e)}")
+
+async def _remove_if_unreferenced(db: AsyncClient, image: dict):
+    content_hash = image.get("content_hash")
+    if content_hash is None:
+        # 没有内容哈希的文件（旧数据）不会被复用
+        await asyncio.to_thread(remove_image_files, image)
+        return
+
+    while True:
+        async with _hash_lock(content_hash):
+            handed_out_at = _handed_out.get((content_hash,))
+            wait = handed_out_at + REUSE_GRACE_SECONDS - time.monotonic() if handed_out_at else 0
+            if wait <= 0:
+                result = await db.table("item_images").select("id") \
+                    .eq("content_hash", content_hash).limit(1).execute()
+                if not result.data:
+                    await asyncio.to_thread(remove_image_files, image)
+                return
+        await asyncio.sleep(wait)
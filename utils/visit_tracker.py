@@ -1,73 +1,144 @@
+import os
+import uuid
+import asyncio
 from fastapi import WebSocket
-from typing import Dict, Set
-from datetime import datetime
+from typing import Dict, Optional
+from utils.counters import Counters, counters as shared_counters
+
+class ClientConnection:
+    """一个 WebSocket 客户端：有界发送队列 + 独立的发送任务"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
 
 class VisitTracker:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}  # IP -> WebSocket
-        self.page_views: Dict[str, int] = {}
-        self.total_visits: int = 0
-
-    def get_client_ip(self, websocket: WebSocket) -> str:
-        """获取WebSocket客户端的IP地址"""
-        client = websocket.client
-        if client is None:
-            return "unknown"
-        return client.host or "unknown"
-
-    async def connect(self, websocket: WebSocket):
-        """处理新的WebSocket连接"""
+    """实时访问统计
+
+    连接按连接 ID 区分（同一个运营商 NAT 后面的很多用户共享一个 IP）。
+    总访问量、页面浏览量和在线人数保存在 Counters 中，多个 worker 共享同一份数据。
+    统计有变化时由定时任务每 tick 秒最多广播一次；
+    每个客户端有自己的有界队列和发送任务，发送超时或队列积压的慢客户端会被断开，
+    不会拖慢其他客户端。
+    """
+
+    def __init__(self, counters: Counters, tick: float = 1.0, send_timeout: float = 2.0, queue_size: int = 4):
+        self.counters = counters
+        self.tick = tick
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.active_connections: Dict[str, ClientConnection] = {}  # 连接 ID -> 连接
+        self.dropped_clients: int = 0
+        self._last_stats: Optional[dict] = None
+        self._ticker: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket) -> str:
+        """处理新的WebSocket连接，返回连接 ID"""
         await websocket.accept()
-        client_ip = self.get_client_ip(websocket)
-        
-        # 如果这个IP之前没有连接，则计为新访问
-        if client_ip not in self.active_connections:
-            self.total_visits += 1
-        
-        # 更新连接
-        self.active_connections[client_ip] = websocket
-        await self.broadcast_stats()
-
-    async def disconnect(self, websocket: WebSocket):
+        connection_id = uuid.uuid4().hex
+        connection = ClientConnection(websocket, self.queue_size)
+        connection.sender = asyncio.create_task(self._send_loop(connection_id, connection))
+        self.active_connections[connection_id] = connection
+        self.counters.incr("total_visits")
+        self.counters.set_gauge("active_users", len(self.active_connections))
+
+        # 新客户端立即收到一次当前统计
+        connection.queue.put_nowait(self.get_stats())
+        return connection_id
+
+    async def disconnect(self, connection_id: str):
         """处理WebSocket断开连接"""
-        client_ip = self.get_client_ip(websocket)
-        if client_ip in self.active_connections:
-            del self.active_connections[client_ip]
-            await self.broadcast_stats()
+        connection = self.active_connections.pop(connection_id, None)
+        if connection is not None:
+            connection.sender.cancel()
+            self.counters.set_gauge("active_users", len(self.active_connections))
 
     def get_active_connections(self) -> int:
-        """获取活动连接数（基于唯一IP）"""
-        return len(self.active_connections)
+        """获取所有 worker 的活动连接数"""
+        return self.counters.get("active_users")
+
+    def get_stats(self) -> dict:
+        return {
+            "active_users": self.get_active_connections(),
+            "total_visits": self.counters.get("total_visits"),
+            "page_views": self.get_page_views('home')
+        }
+
+    async def _send_loop(self, connection_id: str, connection: ClientConnection):
+        try:
+            while True:
+                stats = await connection.queue.get()
+                await asyncio.wait_for(connection.websocket.send_json(stats), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 发送超时或连接已断开
+            self._drop(connection_id)
+
+    def _drop(self, connection_id: str):
+        """断开慢客户端或已失效的客户端"""
+        connection = self.active_connections.pop(connection_id, None)
+        if connection is None:
+            return
+        self.dropped_clients += 1
+        self.counters.set_gauge("active_users", len(self.active_connections))
+        if connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+        asyncio.create_task(self._close(connection.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=1)
+        except Exception:
+            pass
 
     async def broadcast_stats(self):
-        """广播访问统计信息给所有连接的客户端"""
+        """把最新统计放入每个客户端的发送队列，队列已满的客户端被断开"""
         if not self.active_connections:
             return
 
-        stats = {
-            "active_users": self.get_active_connections(),
-            "total_visits": self.total_visits,
-            "page_views": self.page_views.get('home', 0)
-        }
-
-        # 向所有连接的客户端发送更新
-        disconnected_ips = set()
-        for ip, connection in self.active_connections.items():
+        stats = self._last_stats = self.get_stats()
+        for connection_id, connection in list(self.active_connections.items()):
             try:
-                await connection.send_json(stats)
-            except:
-                disconnected_ips.add(ip)
+                connection.queue.put_nowait(stats)
+            except asyncio.QueueFull:
+                self._drop(connection_id)
+
+    async def _run_ticker(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            # 其他 worker 的变化在计数器刷新后才可见，所以按内容比较而不是只看本进程的事件
+            if self.get_stats() != self._last_stats:
+                await self.broadcast_stats()
+
+    def start(self):
+        """启动定时广播任务（在应用 lifespan 中调用）"""
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._run_ticker())
 
-        # 清理断开的连接
-        for ip in disconnected_ips:
-            del self.active_connections[ip]
+    async def stop(self):
+        """停止定时广播并断开所有客户端"""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        for connection_id in list(self.active_connections):
+            connection = self.active_connections.pop(connection_id)
+            connection.sender.cancel()
+            await self._close(connection.websocket)
 
     def increment_page_view(self, page: str):
-        """增加页面访问计数"""
-        self.page_views[page] = self.page_views.get(page, 0) + 1
+        """增加页面访问计数（只修改内存，由计数器批量写入）"""
+        self.counters.incr(f"page_views:{page}")
 
     def get_page_views(self, page: str) -> int:
         """获取页面访问计数"""
-        return self.page_views.get(page, 0)
+        return self.counters.get(f"page_views:{page}")
 
-visit_tracker = VisitTracker()
+visit_tracker = VisitTracker(
+    shared_counters,
+    tick=float(os.getenv("VISIT_STATS_TICK", "1")),
+    send_timeout=float(os.getenv("VISIT_STATS_SEND_TIMEOUT", "2")),
+    queue_size=int(os.getenv("VISIT_STATS_QUEUE_SIZE", "4"))
+)
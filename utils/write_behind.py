@@ -0,0 +1,217 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from supabase import AsyncClient
+from utils.catalog import get_like_state
+from utils.cache import TTLCache
+
+LikeKey = Tuple[int, str]
+
+class WriteBehindQueue:
+    """点赞和评论的延迟批量写入队列
+
+    点赞切换按 (item_id, ip) 合并，只保留最终状态；评论先放在内存里。
+    后台任务每隔 flush_interval 秒或积累 max_events 个事件时批量写入数据库。
+    尚未写入的变更通过 overlay 叠加到读取结果上，用户能立即看到自己的操作。
+    每个 (item_id, ip) 的点赞状态和商品点赞数读取一次后缓存 state_ttl 秒，
+    连续切换不再查询数据库；写入成功后按写入的变化更新缓存。
+    """
+
+    def __init__(self, enabled: bool = False, flush_interval: float = 0.2, max_events: int = 500,
+                 state_ttl: float = 30):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        # (item_id, ip) -> (写入前的状态, 期望的最终状态)
+        self._likes: Dict[LikeKey, Tuple[bool, bool]] = {}
+        self._inflight_likes: Dict[LikeKey, Tuple[bool, bool]] = {}
+        self._comments: List[dict] = []
+        self._inflight_comments: List[dict] = []
+        # 数据库中的点赞状态：(item_id, ip) -> 是否已点赞；item_id -> 点赞数
+        self._like_states = TTLCache(maxsize=10000, ttl=state_ttl)
+        self._like_counts = TTLCache(maxsize=10000, ttl=state_ttl)
+        self._events = 0
+        self._db: Optional[AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.flushed_events = 0
+
+    def start(self, db: AsyncClient):
+        """启动后台写入任务（在应用 lifespan 中调用）"""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写入所有剩余变更"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _record_event(self):
+        self._events += 1
+        if self._events >= self.max_events:
+            self._wakeup.set()
+
+    def _like_delta(self, item_id: int) -> int:
+        delta = 0
+        for likes in (self._inflight_likes, self._likes):
+            for (pending_item_id, _), (base, desired) in likes.items():
+                if pending_item_id == item_id:
+                    delta += int(desired) - int(base)
+        return delta
+
+    def like_overlay(self, item_id: int, ip_address: Optional[str], liked: bool, likes_count: int) -> Tuple[bool, int]:
+        """把尚未写入的点赞变更叠加到数据库读取结果上"""
+        key = (item_id, ip_address)
+        pending = self._likes.get(key) or self._inflight_likes.get(key)
+        if pending is not None:
+            liked = pending[1]
+        return liked, max(likes_count + self._like_delta(item_id), 0)
+
+    async def toggle_like(self, db: AsyncClient, item_id: int, ip_address: str) -> Tuple[bool, int]:
+        """切换点赞状态，写入延迟到下一次批量写入，返回 (是否已点赞, 点赞数)"""
+        key = (item_id, ip_address)
+        db_liked = self._like_states.get(key)
+        db_count = self._like_counts.get((item_id,))
+        if db_liked is None or db_count is None:
+            db_count, db_liked = await get_like_state(db, item_id, ip_address)
+            self._like_states.set(key, db_liked)
+            self._like_counts.set((item_id,), db_count)
+        current, likes_count = self.like_overlay(item_id, ip_address, db_liked, db_count)
+        desired = not current
+
+        base = self._likes[key][0] if key in self._likes else current
+        if desired == base:
+            # 来回切换抵消，不需要写数据库
+            del self._likes[key]
+        else:
+            self._likes[key] = (base, desired)
+        self._record_event()
+        return desired, max(likes_count + int(desired) - int(current), 0)
+
+    def add_comment(self, comment_data: dict) -> dict:
+        """排队一条评论，返回将要写入的数据"""
+        self._comments.append(comment_data)
+        self._record_event()
+        return comment_data
+
+    def pending_comments(self, item_id: int) -> List[dict]:
+        """尚未写入数据库的评论，按时间倒序"""
+        comments = [c for c in self._inflight_comments + self._comments if c["item_id"] == item_id]
+        return sorted(comments, key=lambda c: c["created_at"], reverse=True)
+
+    async def flush(self):
+        """把积累的变更批量写入数据库"""
+        async with self._flush_lock:
+            if not self._likes and not self._comments:
+                return
+
+            self._inflight_likes, self._likes = self._likes, {}
+            self._inflight_comments, self._comments = self._comments, []
+            self._events = 0
+
+            likes = self._inflight_likes
+            comments = self._inflight_comments
+            # 点赞和评论分别写入，只有失败的一方放回队列
+            likes_error, comments_error = await asyncio.gather(
+                self._write_likes(likes), self._write_comments(comments), return_exceptions=True
+            )
+            try:
+                if likes_error is None:
+                    self._apply_written_likes(likes)
+                else:
+                    print(f"Write-behind like flush failed: {str(likes_error)}")
+                    # 点赞的写入是幂等的，整批放回队列重试；期间产生的新切换以新状态为准
+                    for key, state in likes.items():
+                        self._likes.setdefault(key, state)
+                if comments_error is not None:
+                    print(f"Write-behind comment flush failed: {str(comments_error)}")
+                    self._comments = comments + self._comments
+                if likes_error is None and comments_error is None:
+                    self.flushes += 1
+                    self.flushed_events += len(likes) + len(comments)
+            finally:
+                self._inflight_likes = {}
+                self._inflight_comments = []
+
+    def _apply_written_likes(self, likes: Dict[LikeKey, Tuple[bool, bool]]):
+        """写入成功后，缓存中的数据库状态前进到写入后的值"""
+        for key, (base, desired) in likes.items():
+            self._like_states.set(key, desired)
+            count = self._like_counts.get((key[0],))
+            if count is not None:
+                self._like_counts.set((key[0],), max(count + int(desired) - int(base), 0))
+
+    async def _write_likes(self, likes: Dict[LikeKey, Tuple[bool, bool]]):
+        statements = []
+        now = datetime.utcnow().isoformat()
+
+        # 新增的点赞一次批量写入，唯一键冲突时忽略
+        inserts = [
+            {"item_id": item_id, "ip_address": ip_address, "created_at": now}
+            for (item_id, ip_address), (_, desired) in likes.items() if desired
+        ]
+        if inserts:
+            statements.append(
+                self._db.table("likes")
+                    .upsert(inserts, on_conflict="item_id,ip_address", ignore_duplicates=True)
+                    .execute()
+            )
+
+        # 取消的点赞按商品分组删除
+        deletes: Dict[int, List[str]] = {}
+        for (item_id, ip_address), (_, desired) in likes.items():
+            if not desired:
+                deletes.setdefault(item_id, []).append(ip_address)
+        for item_id, ip_addresses in deletes.items():
+            statements.append(
+                self._db.table("likes")
+                    .delete()
+                    .eq("item_id", item_id)
+                    .in_("ip_address", ip_addresses)
+                    .execute()
+            )
+
+        await asyncio.gather(*statements)
+
+    async def _write_comments(self, comments: List[dict]):
+        # 一条语句批量插入，失败时整批都没有写入；批量插入要求每行的列一致
+        if comments:
+            columns = set().union(*comments)
+            rows = [{column: c.get(column) for column in columns} for c in comments]
+            await self._db.table("comments").insert(rows).execute()
+
+    def stats(self) -> dict:
+        """队列状态"""
+        return {
+            "enabled": self.enabled,
+            "pending_likes": len(self._likes),
+            "pending_comments": len(self._comments),
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events
+        }
+
+write_behind = WriteBehindQueue(
+    enabled=os.getenv("WRITE_BEHIND", "0") == "1",
+    flush_interval=int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200")) / 1000,
+    max_events=int(os.getenv("WRITE_BEHIND_MAX_EVENTS", "500")),
+    state_ttl=float(os.getenv("WRITE_BEHIND_STATE_TTL", "30"))
+)